@@ -0,0 +1,390 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from api.metrics import record_cache
+from recipes.models import Favorite, ShopCard
+from user.models import Subscribe
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+RECIPES_VERSION_KEY = 'recipes:version'
+RECIPE_COUNTERS_VERSION_KEY = 'recipes:counters:version'
+
+
+def is_local_cache():
+    """Кеш по умолчанию виден только текущему процессу."""
+    return settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS
+
+
+def is_cache_shared():
+    """Смену версий видят все процессы, которые отдают ответы.
+
+    С кешем в памяти процесса и несколькими воркерами изменение в одном
+    воркере не доходит до остальных, и кеши ответов, фрагментов рецептов
+    и справочников отдавали бы устаревшие данные с верным ETag.
+    """
+    return not is_local_cache() or settings.SERVER_WORKERS <= 1
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, time.time(), None)
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    return [
+        versions[key] if key in versions else get_version(key)
+        for key in keys
+    ]
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe:{recipe_id}:version'
+
+
+def bump_recipe_versions(recipe_ids):
+    """Меняет версии рецептов и общую версию списков после коммита.
+
+    Иначе параллельный запрос может закешировать ещё старый рецепт
+    под новой версией.
+    """
+    def bump():
+        version = time.time()
+        cache.set_many({
+            RECIPES_VERSION_KEY: version,
+            **{recipe_version_key(pk): version for pk in recipe_ids},
+        }, None)
+
+    transaction.on_commit(bump)
+
+
+def shopping_list_cache_key(recipe_ids, file_format):
+    """Ключ выгрузки по составу корзины, а не по пользователю.
+
+    Изменение корзины меняет сам ключ, а в него входят версии рецептов
+    корзины и справочника ингредиентов: правка рецепта сбрасывает только
+    списки с ним.
+    """
+    recipe_ids = sorted(recipe_ids)
+    versions = get_versions([
+        ingredient_cache.version_key, *map(recipe_version_key, recipe_ids)
+    ])
+    digest = hashlib.sha256(
+        f'{versions[0]}|'.encode() + ','.join(
+            f'{pk}:{version}'
+            for pk, version in zip(recipe_ids, versions[1:])
+        ).encode()
+    ).hexdigest()
+    return f'shopping_list:{digest}:{file_format}'
+
+
+class CatalogCache:
+    """Двухуровневый кеш справочника: память процесса и общий кеш Django.
+
+    Версия справочника хранится в общем кеше и меняется при любой записи,
+    поэтому все воркеры одновременно перестают отдавать старые данные.
+    """
+
+    def __init__(self, name, local_size=256):
+        self.name = name
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def version_key(self):
+        return f'catalog:{self.name}:version'
+
+    def get_version(self):
+        return get_version(self.version_key)
+
+    def invalidate(self):
+        # Вторая смена версии после коммита: иначе параллельный запрос
+        # успел бы закешировать ещё старые данные под новой версией.
+        bump_version(self.version_key)
+        transaction.on_commit(lambda: bump_version(self.version_key))
+        with self._lock:
+            self._local.clear()
+
+    def get(self, key, version, default):
+        if not is_cache_shared():
+            return default()
+        local_key = (version, key)
+        with self._lock:
+            if local_key in self._local:
+                self._local.move_to_end(local_key)
+                record_cache(f'{self.name}_local', True)
+                return self._local[local_key]
+        record_cache(f'{self.name}_local', False)
+        shared_key = f'catalog:{self.name}:{version}:{key}'
+        data = cache.get(shared_key)
+        record_cache(f'{self.name}_shared', data is not None)
+        if data is None:
+            data = default()
+            cache.set(shared_key, data, settings.CATALOG_CACHE_TIMEOUT)
+        with self._lock:
+            self._local[local_key] = data
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return data
+
+
+tag_cache = CatalogCache('tags')
+ingredient_cache = CatalogCache('ingredients')
+
+
+class RecipeFragmentCache:
+    """Сериализованные рецепты в памяти процесса и в общем кеше Django.
+
+    Ключ фрагмента включает версию рецепта и версии справочников, поэтому
+    устаревший фрагмент не отдаётся, а просто вытесняется. Флаги
+    пользователя во фрагменте не важны: их проставляет вызывающий код.
+    """
+
+    name = 'recipe_fragments'
+
+    def __init__(self, local_size):
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = Lock()
+
+    def get_keys(self, recipe_ids, scope):
+        *versions, tags_version, ingredients_version = get_versions([
+            *map(recipe_version_key, recipe_ids),
+            tag_cache.version_key, ingredient_cache.version_key,
+        ])
+        return {
+            recipe_id: (f'{self.name}:{scope}:{recipe_id}:{version}:'
+                        f'{tags_version}:{ingredients_version}')
+            for recipe_id, version in zip(recipe_ids, versions)
+        }
+
+    def get_many(self, recipe_ids, scope, build):
+        """Фрагменты по id рецептов; build(ids) сериализует промахи.
+
+        scope отделяет фрагменты с разными абсолютными ссылками.
+        """
+        if not is_cache_shared():
+            return build(recipe_ids)
+        keys = self.get_keys(recipe_ids, scope)
+        fragments = {}
+        with self._lock:
+            for recipe_id, key in keys.items():
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    fragments[recipe_id] = self._local[key]
+        for recipe_id in keys:
+            record_cache(f'{self.name}_local', recipe_id in fragments)
+        missing = {
+            key: recipe_id for recipe_id, key in keys.items()
+            if recipe_id not in fragments
+        }
+        if not missing:
+            return fragments
+        shared = cache.get_many(list(missing))
+        for key in missing:
+            record_cache(f'{self.name}_shared', key in shared)
+        fragments.update(
+            (missing[key], fragment) for key, fragment in shared.items()
+        )
+        misses = [
+            recipe_id for recipe_id in missing.values()
+            if recipe_id not in fragments
+        ]
+        if misses:
+            built = build(misses)
+            cache.set_many(
+                {keys[recipe_id]: built[recipe_id] for recipe_id in built},
+                settings.RECIPE_CACHE_TIMEOUT
+            )
+            fragments.update(built)
+        with self._lock:
+            for key, recipe_id in missing.items():
+                self._local[key] = fragments[recipe_id]
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return fragments
+
+
+recipe_fragments = RecipeFragmentCache(settings.RECIPE_FRAGMENT_LOCAL_SIZE)
+
+
+class CachedCatalogMixin:
+    """Ответы list/retrieve справочника из CatalogCache с ETag."""
+
+    catalog_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, lambda: super(CachedCatalogMixin, self).list(
+                request, *args, **kwargs
+            ).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, lambda: super(CachedCatalogMixin, self).retrieve(
+                request, *args, **kwargs
+            ).data
+        )
+
+    def get_cached_response(self, request, build):
+        if not is_cache_shared():
+            return Response(build())
+        version = self.catalog_cache.get_version()
+        key = request.get_full_path()
+        etag = quote_etag(hashlib.md5(
+            f'{version}:{request.accepted_renderer.format}:{key}'.encode()
+        ).hexdigest())
+        last_modified = int(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(self.catalog_cache.get(key, version, build))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+def get_user_flags(user, recipe_ids, author_ids):
+    """Избранное, корзина и подписки пользователя среди данных рецептов."""
+    return (
+        set(Favorite.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True)),
+        set(ShopCard.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True)),
+        set(Subscribe.objects.filter(
+            user=user, author_id__in=author_ids
+        ).values_list('author_id', flat=True)),
+    )
+
+
+class CachedRecipeMixin:
+    """Ответы list/retrieve рецептов из общего кеша с ETag.
+
+    В кеше лежит отрендеренный JSON анонимного ответа, ключ которого
+    зависит от версий рецептов и справочников. Авторизованному
+    пользователю поверх этого тела проставляются его флаги.
+    """
+
+    # Фильтры, с которыми сам набор рецептов зависит от пользователя.
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+    # Тело для общего кеша строится без флагов пользователя.
+    shared_body = False
+
+    def list(self, request, *args, **kwargs):
+        build = super(CachedRecipeMixin, self).list
+        if request.user.is_authenticated and any(
+            name in request.query_params for name in self.user_filters
+        ):
+            return build(request, *args, **kwargs)
+        keys = [RECIPES_VERSION_KEY]
+        # Счётчики не входят в тело, но от них зависит порядок.
+        if 'popularity' in request.query_params.get('ordering', ''):
+            keys.append(RECIPE_COUNTERS_VERSION_KEY)
+        return self.get_cached_response(
+            request, keys, lambda: build(request, *args, **kwargs),
+            # Без ?limit список отдаётся без пагинации.
+            lambda data: data['results'] if isinstance(data, dict) else data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super(CachedRecipeMixin, self).retrieve
+        pk = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not pk.isdigit():
+            return build(request, *args, **kwargs)
+        return self.get_cached_response(
+            request, [recipe_version_key(int(pk))],
+            lambda: build(request, *args, **kwargs), lambda data: [data]
+        )
+
+    def get_cached_response(self, request, keys, build, get_recipes):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json' or not is_cache_shared():
+            return build()
+        versions = get_versions([
+            *keys, tag_cache.version_key, ingredient_cache.version_key
+        ])
+        etag = hashlib.md5(
+            f'{":".join(map(str, versions))}:{request.accepted_media_type}:'
+            f'{request.build_absolute_uri()}'.encode()
+        ).hexdigest()
+        last_modified = int(max(versions))
+        anonymous = request.user.is_anonymous
+        if anonymous:
+            response = get_conditional_response(
+                request, etag=quote_etag(etag), last_modified=last_modified
+            )
+            if response is not None:
+                return self.add_validators(response, etag, last_modified)
+        cache_key = f'recipes:response:{etag}'
+        content = cache.get(cache_key)
+        record_cache('recipe_responses', content is not None)
+        if content is None:
+            self.shared_body = True
+            try:
+                data = build().data
+            finally:
+                self.shared_body = False
+            content = renderer.render(
+                data, request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            cache.set(cache_key, content, settings.RECIPE_CACHE_TIMEOUT)
+        if anonymous:
+            return self.add_validators(
+                HttpResponse(content, content_type=renderer.media_type),
+                etag, last_modified
+            )
+        data = json.loads(content)
+        recipes = get_recipes(data)
+        favorited, in_cart, subscribed = get_user_flags(
+            request.user, [recipe['id'] for recipe in recipes],
+            {recipe['author']['id'] for recipe in recipes}
+        )
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in favorited
+            recipe['is_in_shopping_cart'] = recipe['id'] in in_cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscribed
+            )
+        etag = hashlib.md5(
+            f'{etag}:{sorted(favorited)}:{sorted(in_cart)}:'
+            f'{sorted(subscribed)}'.encode()
+        ).hexdigest()
+        # Флаги меняются без смены версий, поэтому Last-Modified
+        # авторизованному пользователю не отдаётся.
+        response = get_conditional_response(request, etag=quote_etag(etag))
+        return self.add_validators(response or Response(data), etag)
+
+    def add_validators(self, response, etag, last_modified=None):
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,16 @@
+from django.core.checks import Tags, Warning, register
+
+from api.cache import is_local_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if not is_local_cache():
+        return []
+    return [Warning(
+        'Кеш по умолчанию не общий для процессов: при нескольких воркерах '
+        'ответы и фрагменты рецептов не кешируются, а справочники '
+        'обновляются в воркерах с задержкой.',
+        hint='Задайте CACHE_LOCATION, например redis://cache:6379/0.',
+        id='api.W001',
+    )]
@@ -0,0 +1,160 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from api.cache import shopping_list_cache_key
+from api.metrics import EXPORT_DURATION, EXPORTS, record_cache
+from api.utils import generate_pdf
+from recipes.models import (
+    SHOPPING_LIST_UPLOAD_PATH, RecipeIngredient, ShoppingListExport
+)
+from user.models import User
+
+SHOPPING_LIST_FORMATS = {
+    'pdf': 'application/pdf',
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def get_shopping_list(recipe_ids):
+    return (
+        RecipeIngredient.objects.filter(recipe__in=recipe_ids)
+        .values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        )
+        .annotate(amount=Sum('amount'))
+        .order_by('name')
+    )
+
+
+def get_cached_pdf(recipe_ids):
+    pdf = cache.get(shopping_list_cache_key(recipe_ids, 'pdf'))
+    record_cache('shopping_list', pdf is not None)
+    return pdf
+
+
+def build_pdf(recipe_ids):
+    with EXPORT_DURATION.labels('pdf').time():
+        pdf = generate_pdf(get_shopping_list(recipe_ids)).getvalue()
+    cache.set(shopping_list_cache_key(recipe_ids, 'pdf'), pdf,
+              settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return pdf
+
+
+def render_pdf(recipe_ids):
+    pdf = get_cached_pdf(recipe_ids)
+    if pdf is None:
+        pdf = build_pdf(recipe_ids)
+    return pdf
+
+
+def queue_export(user, recipe_ids):
+    """Ставит корзину в очередь или возвращает её незавершённую выгрузку."""
+    cache_key = shopping_list_cache_key(recipe_ids, 'pdf')
+    with transaction.atomic():
+        # Блокировка пользователя не даёт параллельным запросам
+        # поставить в очередь одну и ту же корзину дважды.
+        User.objects.select_for_update().filter(pk=user.pk).exists()
+        export = ShoppingListExport.objects.filter(
+            user=user, cache_key=cache_key,
+            status__in=(ShoppingListExport.PENDING,
+                        ShoppingListExport.RUNNING)
+        ).first()
+        if export is None:
+            export = ShoppingListExport.objects.create(
+                user=user, recipe_ids=recipe_ids, cache_key=cache_key
+            )
+    return export
+
+
+def claim_export():
+    """Забирает старейшую ожидающую выгрузку; воркеры не мешают друг другу.
+
+    Выгрузка, которая слишком долго формируется, считается брошенной
+    упавшим воркером и забирается снова.
+    """
+    now = timezone.now()
+    stalled = now - timedelta(seconds=settings.SHOPPING_LIST_EXPORT_TIMEOUT)
+    while True:
+        with transaction.atomic():
+            export = (
+                ShoppingListExport.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=ShoppingListExport.PENDING)
+                    | Q(status=ShoppingListExport.RUNNING,
+                        started__lt=stalled)
+                )
+                .order_by('created')
+                .first()
+            )
+            if export is None:
+                return None
+            if export.attempts >= settings.SHOPPING_LIST_EXPORT_ATTEMPTS:
+                export.status = ShoppingListExport.FAILED
+                export.error = 'Воркер не завершил выгрузку.'
+                export.finished = now
+                export.save(update_fields=['status', 'error', 'finished'])
+                EXPORTS.labels(export.status).inc()
+                continue
+            export.status = ShoppingListExport.RUNNING
+            export.attempts += 1
+            export.started = now
+            export.save(update_fields=['status', 'attempts', 'started'])
+            return export
+
+
+def delete_expired_exports():
+    """Удаляет завершённые выгрузки старше срока хранения и их файлы.
+
+    Заодно удаляет и файлы без выгрузок, например оставшиеся после
+    удаления пользователя.
+    """
+    expired = timezone.now() - timedelta(
+        seconds=settings.SHOPPING_LIST_EXPORT_TTL
+    )
+    exports = ShoppingListExport.objects.filter(
+        status__in=(ShoppingListExport.DONE, ShoppingListExport.FAILED),
+        created__lt=expired
+    )
+    deleted, _ = exports.delete()
+    try:
+        _, files = default_storage.listdir(SHOPPING_LIST_UPLOAD_PATH)
+    except FileNotFoundError:
+        return deleted
+    # Файл новой выгрузки сохраняется раньше её записи, поэтому
+    # удаляются только старые файлы.
+    kept = set(
+        ShoppingListExport.objects.exclude(file='')
+        .values_list('file', flat=True)
+    )
+    for name in files:
+        path = f'{SHOPPING_LIST_UPLOAD_PATH}/{name}'
+        if (path not in kept
+                and default_storage.get_modified_time(path) < expired):
+            default_storage.delete(path)
+    return deleted
+
+
+def process_export(export):
+    try:
+        pdf = render_pdf(export.recipe_ids)
+    except Exception as error:
+        export.status = ShoppingListExport.FAILED
+        export.error = str(error)
+    else:
+        export.file.save(f'{export.pk}.pdf', ContentFile(pdf), save=False)
+        export.status = ShoppingListExport.DONE
+    export.finished = timezone.now()
+    export.save()
+    EXPORTS.labels(export.status).inc()
+    return export
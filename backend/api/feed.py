@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import FeedEntry, Recipe
+from user.models import Subscribe
+
+FEED_BATCH_SIZE = 1000
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора.
+
+    У авторов, на которых подписано больше FEED_FANOUT_LIMIT человек,
+    рецепт остаётся с fanned_out=False и добирается в ленты при чтении.
+    """
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Subscribe.objects.filter(author_id=recipe.author_id)
+        .values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        return
+    with transaction.atomic():
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe=recipe)
+             for user_id in followers],
+            batch_size=FEED_BATCH_SIZE, ignore_conflicts=True
+        )
+    recipe.fanned_out = True
+
+
+def backfill(subscription):
+    """Уже разосланные рецепты автора в ленту нового подписчика."""
+    recipe_ids = Recipe.objects.filter(
+        author_id=subscription.author_id, fanned_out=True
+    ).values_list('id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=subscription.user_id, recipe_id=recipe_id)
+         for recipe_id in recipe_ids.iterator()],
+        batch_size=FEED_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def prune(subscription):
+    FeedEntry.objects.filter(
+        user_id=subscription.user_id,
+        recipe__author_id=subscription.author_id
+    ).delete()
+
+
+def get_feed_ids(user, before, size):
+    """id рецептов ленты по убыванию, меньшие before.
+
+    Разосланные рецепты читаются из FeedEntry по индексу (user, recipe),
+    остальные — из рецептов авторов, на которых подписан пользователь.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(
+        fanned_out=False, author__subscribing__user=user
+    )
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+        pulled = pulled.filter(id__lt=before)
+    recipe_ids = set(
+        entries.order_by('-recipe_id')
+        .values_list('recipe_id', flat=True)[:size]
+    )
+    recipe_ids.update(
+        pulled.order_by('-id').values_list('id', flat=True)[:size]
+    )
+    return sorted(recipe_ids, reverse=True)[:size]
@@ -1,5 +1,6 @@
 from django_filters import rest_framework as filters
 
+from api.search import search_ingredients, search_recipes
 from recipes.models import Ingredient, Tag
 from recipes.models import Recipe
 
@@ -14,10 +15,16 @@ class IngredientFilter(filters.FilterSet):
 
     def filter_by_name(self, queryset, name, value):
         if value:
-            return queryset.filter(name__istartswith=value)
+            return search_ingredients(queryset, value)
         return queryset
 
 
+RECIPE_ORDERINGS = {
+    'popularity': ('favorites_count', 'id'),
+    '-popularity': ('-favorites_count', '-id'),
+}
+
+
 class RecipeFilter(filters.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -28,7 +35,34 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         field_name='is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(value, value) for value in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
+
+    def filter_ordering(self, queryset, name, value):
+        # Порядок задаётся в filter_queryset, после поиска.
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ordering = self.form.cleaned_data.get('ordering')
+        if ordering:
+            # Явный порядок важнее релевантности поиска: она лишь
+            # разбивает равенство перед id.
+            *fields, pk = RECIPE_ORDERINGS[ordering]
+            if 'rank' in queryset.query.annotations:
+                fields.append('-rank')
+            queryset = queryset.order_by(*fields, pk)
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        if value:
+            return search_recipes(queryset, value)
+        return queryset
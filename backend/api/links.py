@@ -0,0 +1,75 @@
+import string
+
+from django.core.cache import cache
+
+from api.metrics import record_cache
+from recipes.models import Recipe, ShortLink
+
+BASE62_ALPHABET = string.digits + string.ascii_letters
+
+
+def encode_base62(number):
+    code = ''
+    while True:
+        number, remainder = divmod(number, len(BASE62_ALPHABET))
+        code = BASE62_ALPHABET[remainder] + code
+        if not number:
+            return code
+
+
+def decode_base62(code):
+    number = 0
+    for char in code:
+        number = number * len(BASE62_ALPHABET) + BASE62_ALPHABET.index(char)
+    return number
+
+
+def recipe_code_key(recipe_id):
+    return f'short_link:recipe:{recipe_id}'
+
+
+def code_recipe_key(code):
+    return f'short_link:code:{code}'
+
+
+def get_short_link_code(recipe_id):
+    """Код короткой ссылки на рецепт или None, если рецепта нет."""
+    if not str(recipe_id).isdigit():
+        return None
+    recipe_id = int(recipe_id)
+    code = cache.get(recipe_code_key(recipe_id))
+    record_cache('short_link', code is not None)
+    if code is None:
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            return None
+        link, _ = ShortLink.objects.get_or_create(recipe_id=recipe_id)
+        code = encode_base62(link.pk)
+        cache.set_many({
+            recipe_code_key(recipe_id): code,
+            code_recipe_key(code): recipe_id,
+        }, None)
+    return code
+
+
+async def resolve_short_link(code):
+    """id рецепта по коду короткой ссылки или None."""
+    recipe_id = await cache.aget(code_recipe_key(code))
+    record_cache('short_link', recipe_id is not None)
+    if recipe_id is None:
+        if any(char not in BASE62_ALPHABET for char in code):
+            return None
+        recipe_id = await (
+            ShortLink.objects.filter(pk=decode_base62(code))
+            .values_list('recipe_id', flat=True).afirst()
+        )
+        if recipe_id is None:
+            return None
+        await cache.aset(code_recipe_key(code), recipe_id, None)
+    return recipe_id
+
+
+def forget_short_link(link):
+    cache.delete_many([
+        recipe_code_key(link.recipe_id),
+        code_recipe_key(encode_base62(link.pk)),
+    ])
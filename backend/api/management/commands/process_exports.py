@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.exports import claim_export, delete_expired_exports, process_export
+from api.metrics import MULTIPROC_DIR_ENV, clear_metrics_dir
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает очередь выгрузок списков покупок в PDF и удаляет '
+            'устаревшие выгрузки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать накопившиеся выгрузки и завершиться.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+        parser.add_argument(
+            '--cleanup-interval', type=float, default=60 * 60,
+            help='Как часто в секундах удалять устаревшие выгрузки.'
+        )
+
+    def handle(self, *args, **options):
+        if os.environ.get(MULTIPROC_DIR_ENV):
+            clear_metrics_dir(os.environ[MULTIPROC_DIR_ENV])
+        cleaned = None
+        while True:
+            if (cleaned is None or time.monotonic() - cleaned
+                    >= options['cleanup_interval']):
+                deleted = delete_expired_exports()
+                if deleted:
+                    self.stdout.write(f'Удалено выгрузок: {deleted}')
+                cleaned = time.monotonic()
+            export = claim_export()
+            if export is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            process_export(export)
+            self.stdout.write(f'{export.pk}: {export.status}')
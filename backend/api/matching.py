@@ -0,0 +1,165 @@
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import timedelta
+from threading import Lock
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from api.cache import bump_version, get_version
+from recipes.models import RecipeChange, RecipeIngredient
+
+MATCHING_VERSION_KEY = 'recipe_matching:version'
+# Сколько после создания записи журнала её транзакция может оставаться
+# незакоммиченной и всё ещё попасть в индекс без полной перестройки.
+RECENT_CHANGES = timedelta(minutes=5)
+
+
+def log_recipe_changes(recipe_ids):
+    """Записывает изменение состава рецептов; None — перестроить всё."""
+    RecipeChange.objects.bulk_create(
+        RecipeChange(recipe_id=recipe_id) for recipe_id in recipe_ids
+    )
+    # Версия меняется после коммита, иначе другой процесс может прочитать
+    # журнал до появления в нём новой записи и запомнить новую версию.
+    transaction.on_commit(lambda: bump_version(MATCHING_VERSION_KEY))
+
+
+def remove_posting(postings, ingredient_id, recipe_id):
+    posting = postings[ingredient_id]
+    position = bisect_left(posting, recipe_id)
+    if position < len(posting) and posting[position] == recipe_id:
+        del posting[position]
+    if not posting:
+        del postings[ingredient_id]
+
+
+class RecipeMatcher:
+    """Инвертированный индекс ингредиент → рецепты в памяти процесса.
+
+    Списки рецептов хранятся отсортированными array('q'). При смене
+    версии индекс дочитывает журнал RecipeChange и перечитывает составы
+    только изменённых рецептов.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._last_change = None
+        self._recent = {}
+        self._postings = {}
+        self._recipes = {}
+
+    def read_recent(self):
+        """Недавние записи журнала: id → время создания."""
+        return dict(
+            RecipeChange.objects.filter(
+                created__gte=timezone.now() - RECENT_CHANGES
+            ).values_list('id', 'created')
+        )
+
+    def build(self):
+        last_change = RecipeChange.objects.aggregate(last=Max('id'))['last']
+        # Читается до составов: всё, что здесь видно, уже есть и в них.
+        recent = self.read_recent()
+        postings = {}
+        recipes = {}
+        rows = RecipeIngredient.objects.order_by(
+            'recipe_id', 'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows.iterator():
+            postings.setdefault(ingredient_id, array('q')).append(recipe_id)
+            recipes.setdefault(recipe_id, set()).add(ingredient_id)
+        self._postings, self._recipes = postings, recipes
+        self._last_change = last_change or 0
+        self._recent = recent
+
+    def apply_changes(self):
+        first = RecipeChange.objects.aggregate(first=Min('id'))['first']
+        # Записи, которые индекс ещё не видел, уже удалены из журнала.
+        if first is not None and first > self._last_change + 1:
+            return self.build()
+        # id выдаются до коммита, и транзакция с меньшим id может
+        # закоммититься позже большего. Поэтому кроме записей после
+        # последней прочитанной дочитываются и недавние, ещё не виденные.
+        cutoff = timezone.now() - RECENT_CHANGES
+        changed = [
+            (change_id, recipe_id, created)
+            for change_id, recipe_id, created in RecipeChange.objects.filter(
+                Q(id__gt=self._last_change) | Q(created__gte=cutoff)
+            ).values_list('id', 'recipe_id', 'created')
+            if change_id not in self._recent
+        ]
+        recipe_ids = {recipe_id for _, recipe_id, _ in changed}
+        if None in recipe_ids:
+            return self.build()
+        self._recent = {
+            change_id: created
+            for change_id, created in self._recent.items()
+            if created >= cutoff
+        }
+        if not changed:
+            return
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id')
+        ingredients = {recipe_id: set() for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in rows:
+            ingredients[recipe_id].add(ingredient_id)
+        for recipe_id, new in ingredients.items():
+            old = self._recipes.pop(recipe_id, set())
+            for ingredient_id in old - new:
+                remove_posting(self._postings, ingredient_id, recipe_id)
+            for ingredient_id in new - old:
+                insort(
+                    self._postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+            if new:
+                self._recipes[recipe_id] = new
+        self._last_change = max(
+            self._last_change, *(change_id for change_id, _, _ in changed)
+        )
+        self._recent.update(
+            (change_id, created) for change_id, _, created in changed
+        )
+
+    def sync(self):
+        version = get_version(MATCHING_VERSION_KEY)
+        with self._lock:
+            if version == self._version:
+                return
+            if self._last_change is None:
+                self.build()
+            else:
+                self.apply_changes()
+            self._version = version
+
+    def match(self, ingredient_ids, limit):
+        """Рецепты по доле имеющихся ингредиентов, лучшие первыми.
+
+        Возвращает кортежи (recipe_id, coverage, missing_ingredient_ids).
+        """
+        self.sync()
+        with self._lock:
+            counts = Counter()
+            for ingredient_id in ingredient_ids:
+                counts.update(self._postings.get(ingredient_id, ()))
+            ranked = heapq.nsmallest(
+                limit, counts.items(),
+                key=lambda item: (
+                    -item[1] / len(self._recipes[item[0]]), -item[1],
+                    -item[0]
+                )
+            )
+            return [
+                (recipe_id, matched / len(self._recipes[recipe_id]),
+                 sorted(self._recipes[recipe_id] - ingredient_ids))
+                for recipe_id, matched in ranked
+            ]
+
+
+recipe_matcher = RecipeMatcher()
@@ -0,0 +1,216 @@
+import glob
+import hmac
+import os
+import socket
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess, values
+)
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+# Каталоги метрик других сервисов через запятую: /metrics сводит их
+# вместе со своим, например счётчики воркера выгрузок.
+EXTRA_DIRS_ENV = 'METRICS_EXTRA_DIRS'
+
+
+def process_identifier(pid=None):
+    """Имя файлов метрик процесса.
+
+    Каталог метрик сервиса может быть общим для нескольких его
+    контейнеров, а PID в них совпадают, поэтому к нему добавляется имя
+    хоста.
+    """
+    return f'{socket.gethostname()}-{pid or os.getpid()}'
+
+
+def clear_metrics_dir(directory):
+    """Удаляет файлы метрик прошлых запусков сервиса.
+
+    prometheus_client ждёт пустой каталог при старте, иначе в выдаче
+    остаются счётчики давно завершённых процессов. Файлы текущего
+    процесса не трогаются: он мог уже начать в них писать.
+    """
+    os.makedirs(directory, exist_ok=True)
+    own = f'_{process_identifier()}.db'
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        if not path.endswith(own):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class MetricsDirsCollector:
+    """Сводит файлы метрик нескольких каталогов, как MultiProcessCollector."""
+
+    def __init__(self, directories):
+        self.directories = directories
+
+    def collect(self):
+        return multiprocess.MultiProcessCollector.merge(
+            [path for directory in self.directories
+             for path in glob.glob(os.path.join(directory, '*.db'))],
+            accumulate=True
+        )
+
+
+# Выбирается до создания первой метрики.
+if os.environ.get(MULTIPROC_DIR_ENV):
+    values.ValueClass = values.MultiProcessValue(process_identifier)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время ответа API по basename роутера.',
+    ['route', 'method', 'status'],
+)
+DB_QUERIES = Counter(
+    'foodgram_db_queries',
+    'Число SQL-запросов по basename роутера.',
+    ['route'],
+)
+DB_CONNECTIONS = Counter(
+    'foodgram_db_connections_opened',
+    'Новые подключения к базе по алиасу.',
+    ['alias'],
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests',
+    'Обращения к кешам: попадания и промахи.',
+    ['cache', 'result'],
+)
+EXPORT_DURATION = Histogram(
+    'foodgram_shopping_list_render_seconds',
+    'Время генерации файла списка покупок.',
+    ['format'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+EXPORTS = Counter(
+    'foodgram_shopping_list_exports',
+    'Фоновые выгрузки списков покупок по итоговому статусу.',
+    ['status'],
+)
+
+# Маршруты вне v1_router (админка, короткие ссылки, сами метрики)
+# собираются под одной меткой, чтобы не плодить ряды.
+OTHER_ROUTE = 'other'
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def wrap_queries(wrapper):
+    """ExitStack с wrapper на всех подключениях текущего потока."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+async def await_with_queries(wrapper, coroutine):
+    """Ожидает ответ асинхронной цепочки, оборачивая её SQL-запросы.
+
+    Подключения у каждого потока свои, а синхронный код запроса под ASGI,
+    включая async-методы ORM, выполняется в отдельном потоке, общем для
+    всего запроса. Поэтому обёртки ставятся и снимаются в нём же.
+    """
+    stack = await sync_to_async(wrap_queries)(wrapper)
+    try:
+        return await coroutine
+    finally:
+        await sync_to_async(stack.close)()
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Задержка и число SQL-запросов каждого ответа API."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.routes = {}
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def get_route(self, url_name):
+        route = self.routes.get(url_name)
+        if route is None:
+            from api.urls import v1_router
+
+            route = next(
+                (basename for _, _, basename in v1_router.registry
+                 if url_name and url_name.startswith(f'{basename}-')),
+                OTHER_ROUTE
+            )
+            self.routes[url_name] = route
+        return route
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        count_query = QueryCounter()
+        started = time.perf_counter()
+        with wrap_queries(count_query):
+            response = self.get_response(request)
+        return self.observe(request, response, started, count_query.count)
+
+    async def __acall__(self, request):
+        count_query = QueryCounter()
+        started = time.perf_counter()
+        response = await await_with_queries(
+            count_query, self.get_response(request)
+        )
+        return self.observe(request, response, started, count_query.count)
+
+    def observe(self, request, response, started, queries):
+        match = request.resolver_match
+        route = self.get_route(match.url_name if match else None)
+        REQUEST_LATENCY.labels(
+            route, request.method, f'{response.status_code // 100}xx'
+        ).observe(time.perf_counter() - started)
+        if queries:
+            DB_QUERIES.labels(route).inc(queries)
+        return response
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        registry.register(MetricsDirsCollector([
+            os.environ[MULTIPROC_DIR_ENV],
+            *filter(None, os.environ.get(EXTRA_DIRS_ENV, '').split(',')),
+        ]))
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
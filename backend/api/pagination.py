@@ -1,5 +1,211 @@
-from rest_framework.pagination import LimitOffsetPagination
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (
+    BasePagination, CursorPagination, LimitOffsetPagination
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.filters import RECIPE_ORDERINGS
+
+
+def approximate_count(queryset):
+    """Число строк по статистике PostgreSQL вместо COUNT(*).
+
+    Оценка годится только для запроса без условий; иначе, как и на других
+    СУБД, считается точное значение.
+    """
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return queryset.count()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # До первого ANALYZE reltuples равен -1.
+    if row is None or row[0] < 0:
+        return queryset.count()
+    return row[0]
 
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 6
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def get_count(self, queryset, request):
+        count = request.query_params.get(self.count_query_param)
+        if count == 'approximate':
+            return approximate_count(queryset)
+        if count == 'exact':
+            return queryset.count()
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class PopularityCursorPagination(RecipeCursorPagination):
+    """Keyset по паре (favorites_count, id) для ?ordering=±popularity.
+
+    Курсор DRF строится по первому полю порядка, а одинаковые счётчики
+    листает через OFFSET, который обрезан на offset_cutoff: за ним
+    страницы повторялись бы. Здесь курсор — значения последнего рецепта
+    страницы, и следующая страница берётся условием без OFFSET.
+    """
+
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = request.query_params[self.ordering_query_param]
+        queryset = queryset.order_by(*RECIPE_ORDERINGS[ordering])
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is not None:
+            try:
+                favorites, pk = map(int, cursor.split('.'))
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            after = 'lt' if ordering.startswith('-') else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'favorites_count__{after}': favorites})
+                | Q(favorites_count=favorites, **{f'id__{after}': pk})
+            )
+        page = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            last = page[self.page_size - 1]
+            self.next_position = f'{last.favorites_count}.{last.pk}'
+        self.display_page_controls = self.next_position is not None
+        return page[:self.page_size]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.next_position
+        )
+
+    def get_previous_link(self):
+        return None
+
+
+class RecipePagination(CustomLimitOffsetPagination):
+    """limit/offset по умолчанию, курсор по ?pagination=cursor.
+
+    Курсор не делает OFFSET и COUNT(*), поэтому глубокие страницы ленты
+    отдаются так же быстро, как первая.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_pagination_class = RecipeCursorPagination
+    popularity_pagination_class = PopularityCursorPagination
+    # Порядок по релевантности поиска курсором не выразить.
+    cursor_incompatible_params = ('search',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param
+                in request.query_params):
+            if any(request.query_params.get(name)
+                   for name in self.cursor_incompatible_params):
+                raise ValidationError({self.mode_query_param: (
+                    'Курсор недоступен вместе с параметрами: '
+                    + ', '.join(self.cursor_incompatible_params)
+                )})
+            self.cursor_paginator = (
+                self.popularity_pagination_class()
+                if request.query_params.get(
+                    self.popularity_pagination_class.ordering_query_param
+                ) in RECIPE_ORDERINGS
+                else self.cursor_pagination_class()
+            )
+            page = self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+            self.display_page_controls = (
+                self.cursor_paginator.display_page_controls
+            )
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+
+class FeedPagination(BasePagination):
+    """Keyset-пагинация ленты подписок по id последнего рецепта."""
+
+    page_size = 6
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_ids(self, get_ids, request):
+        """get_ids(before, size) отдаёт id по убыванию, меньшие before."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is not None and not cursor.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        size = self.get_page_size(request)
+        ids = get_ids(cursor and int(cursor), size + 1)
+        self.request = request
+        self.next_cursor = ids[size - 1] if len(ids) > size else None
+        return ids[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,167 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from api.metrics import await_with_queries, wrap_queries
+
+logger = logging.getLogger('api.profiling')
+
+# Длина SQL дублирующегося запроса в логе.
+SQL_LOG_LENGTH = 300
+
+
+class RequestProfile:
+    """Замеры одного запроса: SQL, сериализация и рендеринг."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    def start_render(self):
+        self.render_started = time.perf_counter()
+
+    def finish_render(self, response):
+        if self.render_started is not None:
+            self.render_time += time.perf_counter() - self.render_started
+            self.render_started = None
+        return response
+
+    def duplicates(self, threshold):
+        """Одинаковые SQL-шаблоны, выполненные threshold раз и больше.
+
+        Параметры в шаблон не входят, поэтому N+1 по разным объектам
+        выглядит как один многократно повторённый запрос.
+        """
+        return [
+            {'sql': sql[:SQL_LOG_LENGTH], 'count': count}
+            for sql, count in self.queries.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self, total, duplicates):
+        queries = sum(self.queries.values())
+        description = f'{queries} queries'
+        if duplicates:
+            description += f', {len(duplicates)} duplicated'
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{description}"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+class ProfilingMiddleware:
+    """Выборочный профиль запросов в Server-Timing и в лог api.profiling.
+
+    Включается долей запросов PROFILING_SAMPLE_RATE; при нуле middleware
+    отключается Django при старте и ничего не стоит.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.PROFILING_SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.threshold = settings.PROFILING_DUPLICATE_THRESHOLD
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = request.profile = RequestProfile()
+        with wrap_queries(profile.record_query):
+            response = self.get_response(request)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        profile = request.profile = RequestProfile()
+        response = await await_with_queries(
+            profile.record_query, self.get_response(request)
+        )
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        duplicates = profile.duplicates(self.threshold)
+        response['Server-Timing'] = profile.server_timing(total, duplicates)
+        match = request.resolver_match
+        logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'db_queries': sum(profile.queries.values()),
+                'db_ms': round(profile.db_time * 1000, 1),
+                'serialize_ms': round(profile.serialize_time * 1000, 1),
+                'render_ms': round(profile.render_time * 1000, 1),
+                'duplicates': duplicates,
+            }, ensure_ascii=False)
+        )
+        return response
+
+
+class ProfilingMixin:
+    """Время сериализации и рендеринга DRF для ProfilingMiddleware."""
+
+    def get_profile(self):
+        return getattr(self.request._request, 'profile', None)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        profile = self.get_profile()
+        if profile is not None:
+            to_representation = serializer.to_representation
+
+            def timed_to_representation(instance):
+                started = time.perf_counter()
+                try:
+                    return to_representation(instance)
+                finally:
+                    profile.serialize_time += time.perf_counter() - started
+
+            serializer.to_representation = timed_to_representation
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        profile = self.get_profile()
+        # Django рендерит ответ сразу после возврата из представления.
+        if profile is not None and hasattr(
+            response, 'add_post_render_callback'
+        ):
+            profile.start_render()
+            response.add_post_render_callback(profile.finish_render)
+        return response
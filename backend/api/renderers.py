@@ -0,0 +1,80 @@
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Типы, которые orjson пишет сам, но иначе, чем JSONEncoder DRF:
+# даты и dataclass уходят в encoder_class().default.
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+) if orjson else 0
+
+
+# orjson читает целые вне 64 бит как float, а json — как int. Такие
+# числа ищутся по 19 цифрам подряд: translate и find в разы быстрее re.
+DIGITS = bytes(48 if 48 <= code <= 57 else 32 for code in range(256))
+LONG_NUMBER = b'0' * 19
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же байтовым выводом.
+
+    Без orjson, с отступами и с нестандартными настройками UNICODE_JSON,
+    COMPACT_JSON и STRICT_JSON работает стандартный рендерер. Целые вне
+    64 бит и строки с суррогатами orjson не пишет: тогда тоже
+    стандартный. Float в экспоненциальной записи (меньше 1e-4 и от 1e16)
+    orjson пишет без плюса и ведущего нуля в степени; в ответах API
+    таких значений нет.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii
+            or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранирует разделители строк для JavaScript.
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return content
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser на orjson для тел в UTF-8."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if (orjson is None or not self.strict
+                or codecs.lookup(encoding).name != 'utf-8'):
+            return super().parse(stream, media_type, parser_context)
+        content = stream.read()
+        if LONG_NUMBER not in content.translate(DIGITS):
+            try:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError:
+                # Суррогаты принимает только json, а его сообщение
+                # нужно и для настоящих ошибок.
+                pass
+        return super().parse(io.BytesIO(content), media_type, parser_context)
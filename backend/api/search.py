@@ -0,0 +1,160 @@
+from threading import Lock
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import (
+    Case, Exists, F, IntegerField, OuterRef, Q, Subquery, TextField, Value,
+    When
+)
+from django.db.models.functions import Coalesce
+
+from api.cache import ingredient_cache
+from recipes.models import Ingredient, RecipeIngredient
+
+# Словарь полнотекстового поиска по рецептам.
+SEARCH_CONFIG = 'russian'
+
+# Поиск по подстроке опирается на триграммы, а они есть только у
+# запросов от трёх символов; более короткие ищутся лишь по префиксу.
+SUBSTRING_SEARCH_MIN_LENGTH = 3
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+
+class IngredientSearchIndex:
+    """Префиксное дерево названий ингредиентов в памяти процесса.
+
+    Используется вместо индексов PostgreSQL на других СУБД: SQLite, на
+    которой гоняются тесты, не умеет сравнивать кириллицу без учёта
+    регистра. Дерево перестраивается при смене версии ingredient_cache.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._root = TrieNode()
+        self._names = []
+        self._lock = Lock()
+
+    def build(self, version):
+        root = TrieNode()
+        names = []
+        ingredients = Ingredient.objects.order_by('name').values_list(
+            'id', 'name'
+        )
+        for pk, name in ingredients.iterator():
+            name = name.casefold()
+            names.append((name, pk))
+            node = root
+            for char in name:
+                node = node.children.setdefault(char, TrieNode())
+                node.ids.append(pk)
+        self._root, self._names, self._version = root, names, version
+
+    def search(self, value):
+        """id совпадений по началу названия и по подстроке."""
+        version = ingredient_cache.get_version()
+        with self._lock:
+            if version != self._version:
+                self.build(version)
+        value = value.casefold()
+        node = self._root
+        for char in value:
+            node = node.children.get(char)
+            if node is None:
+                prefix_ids = []
+                break
+        else:
+            prefix_ids = node.ids
+        if len(value) < SUBSTRING_SEARCH_MIN_LENGTH:
+            return list(prefix_ids), []
+        found = set(prefix_ids)
+        return list(prefix_ids), [
+            pk for name, pk in self._names
+            if pk not in found and value in name
+        ]
+
+
+ingredient_search_index = IngredientSearchIndex()
+
+
+def search_ingredients(queryset, value):
+    """Сначала совпадения по началу названия, затем по подстроке."""
+    if connection.vendor != 'postgresql':
+        prefix_ids, substring_ids = ingredient_search_index.search(value)
+        # Ранжирует база, как и на PostgreSQL: одно условие на группу
+        # вместо отдельной ветки CASE на каждый найденный id.
+        return queryset.filter(pk__in=[*prefix_ids, *substring_ids]).alias(
+            rank=Case(
+                When(pk__in=prefix_ids, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('rank', 'name')
+    if len(value) < SUBSTRING_SEARCH_MIN_LENGTH:
+        return queryset.filter(name__istartswith=value).order_by('name')
+    return queryset.filter(name__icontains=value).alias(
+        rank=Case(
+            When(name__istartswith=value, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('rank', 'name')
+
+
+def recipe_search_vector(recipe_ingredient_model=RecipeIngredient):
+    """Вектор рецепта: название важнее ингредиентов, а те — текста.
+
+    Модель ингредиентов рецепта передаёт миграция, заполняющая вектор.
+    """
+    ingredient_names = Subquery(
+        recipe_ingredient_model.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredient_names, Value(''), output_field=TextField()),
+            weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает search_vector рецептов одним UPDATE.
+
+    Вызывается после записи ингредиентов рецепта, потому что
+    RecipeMakeSerializer пишет их через bulk_create без сигналов.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    queryset.update(search_vector=recipe_search_vector())
+
+
+def search_recipes(queryset, value):
+    """Рецепты по названию, ингредиентам и тексту, лучшие первыми.
+
+    На других СУБД, где вектора нет, ищется вхождение подстроки.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+            | Q(Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=value
+            )))
+        )
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).alias(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-id')
@@ -1,9 +1,15 @@
 from rest_framework import serializers
 from djoser.serializers import UserSerializer
 from django.core.files.base import ContentFile
+from django.db.models import Prefetch, Value, prefetch_related_objects
 from rest_framework.fields import SerializerMethodField
 import base64
 
+from api.cache import bump_recipe_versions, recipe_fragments
+from api.feed import fan_out
+from api.matching import log_recipe_changes
+from api.search import update_search_vectors
+
 from recipes.models import (
     Recipe, RecipeIngredient, Favorite, ShopCard,
     Tag, Ingredient
@@ -11,6 +17,18 @@ from recipes.models import (
 from user.models import User, Subscribe
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        return max(int(recipes_limit), 0)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Ожидается целое число.'}
+        )
+
+
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
@@ -32,6 +50,10 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        # Списки пользователей и авторов рецептов приходят из вьюсетов
+        # с уже посчитанной аннотацией is_subscribed.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -47,14 +69,19 @@ class SubscriptionsSerializers(CustomUserSerializer):
                                                      'recipes',)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj).order_by('-id')
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'preview_recipes'):
+            recipes = obj.preview_recipes
+        else:
+            recipes = obj.recipes.order_by('-id')
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeSubSerializer(
             recipes, many=True,
             context={'request': request}
@@ -144,6 +171,7 @@ class RecipeMakeSerializer(serializers.ModelSerializer):
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
+        log_recipe_changes([recipe.pk])
         recipe.tags.set(tags)
 
     def create(self, validated_data):
@@ -159,6 +187,12 @@ class RecipeMakeSerializer(serializers.ModelSerializer):
         author = self.context['request'].user
         recipe = Recipe.objects.create(author=author, **validated_data)
         self._set_ingredients_and_tags(recipe, ingredients, tags)
+        update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        bump_recipe_versions([recipe.pk])
+        fan_out(recipe)
+        # Новый рецепт ещё никто не добавил в избранное или в корзину.
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
         return recipe
 
     def update(self, instance, validated_data):
@@ -167,7 +201,10 @@ class RecipeMakeSerializer(serializers.ModelSerializer):
         instance.tags.clear()
         instance.ingredients.clear()
         self._set_ingredients_and_tags(instance, ingredients, tags)
-        return super().update(instance, validated_data)
+        # Поисковый вектор пересчитывает сигнал post_save рецепта.
+        instance = super().update(instance, validated_data)
+        bump_recipe_versions([instance.pk])
+        return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -175,9 +212,60 @@ class RecipeMakeSerializer(serializers.ModelSerializer):
         return RecipeSerializer(instance, context=context).data
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов из кеша фрагментов.
+
+    Связанные объекты догружаются и сериализуются только для промахов;
+    флаги пользователя берутся из аннотаций queryset вьюсета.
+    """
+
+    def to_representation(self, data):
+        recipes = list(data)
+        request = self.context.get('request')
+        fragments = recipe_fragments.get_many(
+            [recipe.pk for recipe in recipes],
+            # Без запроса ImageField отдаёт относительные ссылки.
+            request.build_absolute_uri('/') if request else '',
+            lambda ids: self.serialize(recipes, set(ids))
+        )
+        return [
+            {
+                **fragments[recipe.pk],
+                'author': {
+                    **fragments[recipe.pk]['author'],
+                    'is_subscribed': recipe.is_author_subscribed,
+                },
+                'is_favorited': recipe.is_favorited,
+                'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            }
+            for recipe in recipes
+        ]
+
+    def serialize(self, recipes, recipe_ids):
+        recipes = [recipe for recipe in recipes if recipe.pk in recipe_ids]
+        prefetch_related_objects(
+            recipes,
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=Value(False))
+            ),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            'tags'
+        )
+        return {
+            recipe.pk: self.child.to_representation(recipe)
+            for recipe in recipes
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField(read_only=True)
+    ingredients = IngredientRecipeSerializer(
+        source='recipe_ingredients', many=True, read_only=True
+    )
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.BooleanField()
     is_in_shopping_cart = serializers.BooleanField()
@@ -189,22 +277,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
         model = Recipe
-
-    def get_ingredients(self, obj):
-        queryset = obj.recipe_ingredients.all()
-        return IngredientRecipeSerializer(queryset, many=True).data
-
-    def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Favorite.objects.filter(user=user, recipe=obj).exists()
-        return False
-
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return ShopCard.objects.filter(user=user, recipe=obj).exists()
-        return False
+        list_serializer_class = RecipeListSerializer
 
 
 class FavShopSerializer(RecipeSerializer):
@@ -220,6 +293,22 @@ class RecipeSubSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=100
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=6)
+
+
+class RecipeMatchSerializer(RecipeSubSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(RecipeSubSerializer.Meta):
+        fields = RecipeSubSerializer.Meta.fields + ('coverage', 'missing')
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+from api.cache import (
+    RECIPE_COUNTERS_VERSION_KEY, bump_recipe_versions, bump_version,
+    ingredient_cache, tag_cache
+)
+from api.feed import backfill, prune
+from api.links import forget_short_link
+from api.matching import log_recipe_changes
+from api.metrics import DB_CONNECTIONS
+from api.search import update_search_vectors
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShopCard, ShortLink, Tag
+)
+from user.models import Subscribe, User
+
+
+@receiver(connection_created)
+def count_db_connection(connection, **kwargs):
+    DB_CONNECTIONS.labels(connection.alias).inc()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag_cache(**kwargs):
+    tag_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_cache(**kwargs):
+    # Версия справочника входит и в ключи списков покупок.
+    ingredient_cache.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes(instance, created, **kwargs):
+    # Название ингредиента входит в поисковый вектор рецептов с ним.
+    if not created:
+        update_search_vectors(
+            Recipe.objects.filter(recipe_ingredients__ingredient=instance)
+        )
+
+
+# Сериализатор сам меняет версию рецепта, когда всё записано; сигналы
+# нужны для удаления и правок через админку.
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_responses(instance, **kwargs):
+    bump_recipe_versions([instance.pk])
+
+
+# Поисковый вектор пересчитывается при любом сохранении рецепта, в том
+# числе из админки. Только что созданному рецепту сериализатор
+# пересчитывает его ещё раз, когда запишет ингредиенты.
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & update_fields:
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+# Версии рецептов входят и в ключи списков покупок с ними.
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredient_responses(instance, **kwargs):
+    bump_recipe_versions([instance.recipe_id])
+    update_search_vectors(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, action, reverse, pk_set,
+                                  **kwargs):
+    if action.startswith('post_'):
+        bump_recipe_versions(
+            list(pk_set or ()) if reverse else [instance.pk]
+        )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(instance, created, update_fields, **kwargs):
+    # Вход пользователя меняет только last_login, которого нет в ответах.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    bump_recipe_versions(list(instance.recipes.values_list('pk', flat=True)))
+
+
+@receiver(post_delete, sender=Recipe)
+def log_deleted_recipe(instance, **kwargs):
+    log_recipe_changes([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def log_recipe_ingredients(instance, **kwargs):
+    log_recipe_changes([instance.recipe_id])
+
+
+COUNTER_FIELDS = {Favorite: 'favorites_count', ShopCard: 'in_carts_count'}
+
+
+def change_counter(recipe_id, field, delta):
+    # F() вместо чтения и записи значения: параллельные запросы не
+    # перетирают изменения друг друга. Счётчик мог разойтись с числом
+    # строк, а отрицательное значение нарушило бы CHECK столбца.
+    Recipe.objects.filter(pk=recipe_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    transaction.on_commit(lambda: bump_version(RECIPE_COUNTERS_VERSION_KEY))
+
+
+# Избранное и корзину меняют не только действия API, но и админка и
+# каскадное удаление пользователя.
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShopCard)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(instance.recipe_id, COUNTER_FIELDS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShopCard)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(instance.recipe_id, COUNTER_FIELDS[sender], -1)
+
+
+@receiver(post_delete, sender=ShortLink)
+def invalidate_short_link(instance, **kwargs):
+    forget_short_link(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        backfill(instance)
+
+
+@receiver(post_delete, sender=Subscribe)
+def prune_feed(instance, **kwargs):
+    prune(instance)
@@ -1,3 +1,1730 @@
-from django.test import TestCase
+import datetime
+import decimal
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Max, Value
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from fpdf import FPDF
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.cache import bump_version, ingredient_cache
+from api.exports import claim_export
+from api.filters import RecipeFilter
+from api.matching import MATCHING_VERSION_KEY, RecipeMatcher
+from api.metrics import clear_metrics_dir
+from api.profiling import RequestProfile
+from api.renderers import ORJSONParser, ORJSONRenderer
+from api.search import search_ingredients
+from api.urls import v1_router
+from api.utils import FONTS_DIR, add_font, format_ingredient
+from recipes.loaders import read_json
+from recipes.models import (
+    FeedEntry, Favorite, Ingredient, Recipe, RecipeChange, RecipeIngredient,
+    RecipeTag, ShopCard, ShoppingListExport, ShortLink, Tag
+)
+from user.models import Subscribe, User
+
+SMALL_GIF = (
+    'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAI'
+    'BRAA7'
+)
+
+
+class IsSubscribedQueriesTest(TestCase):
+    PAGE_SIZES = (1, 8)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        for index in range(max(cls.PAGE_SIZES)):
+            author = User.objects.create_user(
+                email=f'author{index}@foodgram.ru', username=f'author{index}',
+                first_name='Автор', last_name='Авторов', password='pass'
+            )
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', text='Описание',
+                image='recipe_images/test.png', cooking_time=10
+            )
+            if index % 2:
+                Subscribe.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, context.captured_queries
+
+    def test_users_list_query_count_does_not_depend_on_page_size(self):
+        counts = []
+        for limit in self.PAGE_SIZES:
+            response, queries = self.get_queries(f'/api/users/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_recipes_list_resolves_subscriptions_in_one_query(self):
+        for limit in self.PAGE_SIZES:
+            response, queries = self.get_queries(
+                f'/api/recipes/?limit={limit}'
+            )
+            subscribe_queries = [
+                query for query in queries
+                if Subscribe._meta.db_table in query['sql']
+            ]
+            self.assertEqual(len(subscribe_queries), 1)
+        subscribed = {
+            recipe['author']['id']: recipe['author']['is_subscribed']
+            for recipe in response.data['results']
+        }
+        expected = set(
+            Subscribe.objects.filter(user=self.user)
+            .values_list('author', flat=True)
+        )
+        self.assertEqual(
+            {pk for pk, value in subscribed.items() if value}, expected
+        )
+
+
+class SubscriptionsQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        for index in range(6):
+            author = User.objects.create_user(
+                email=f'author{index}@foodgram.ru', username=f'author{index}',
+                first_name='Автор', last_name='Авторов', password='pass'
+            )
+            Subscribe.objects.create(user=cls.user, author=author)
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author, name=f'Рецепт {index}.{number}',
+                    text='Описание', image='recipe_images/test.png',
+                    cooking_time=10
+                ) for number in range(index)
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        counts = []
+        for limit in (1, 6):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(
+                    f'/api/users/subscriptions/?limit={limit}'
+                    '&recipes_limit=2'
+                )
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        for author in response.data['results']:
+            recipes = Recipe.objects.filter(author_id=author['id'])
+            self.assertEqual(author['recipes_count'], recipes.count())
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.order_by('-id').values_list('id', flat=True)[:2])
+            )
+            self.assertTrue(author['is_subscribed'])
+
+
+class QueryBudgetTest(TestCase):
+    """Количество запросов на маршрут не должно расти вместе с данными."""
+
+    # Маршруты с GET, которые не участвуют в проверке, и причина.
+    SKIPPED_ROUTES = {
+        'recipe-download-cart-export': 'отдаёт одну выгрузку по её id',
+        'recipe-what-to-cook': 'требует ?ingredients, см. RecipeMatcherTest',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.seeded = 0
+
+    def seed(self, count):
+        for _ in range(count):
+            index = self.seeded
+            self.seeded += 1
+            author = User.objects.create(
+                email=f'author{index}@foodgram.ru', username=f'author{index}',
+                first_name='Автор', last_name='Авторов'
+            )
+            tag = Tag.objects.create(name=f'Тэг {index}', slug=f'tag{index}')
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(name=f'Ингредиент {index}.{number}',
+                           measurement_unit='г')
+                for number in range(3)
+            )
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', text='Описание',
+                image='recipe_images/test.png', cooking_time=10
+            )
+            recipe.tags.set([tag])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for number, ingredient in enumerate(ingredients)
+            )
+            Subscribe.objects.create(user=self.user, author=author)
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShopCard.objects.create(user=self.user, recipe=recipe)
+
+    def routes(self):
+        recipe = Recipe.objects.first()
+        return {
+            'api-root': reverse('api-root'),
+            'tags-list': reverse('tags-list'),
+            'tags-detail': reverse(
+                'tags-detail', args=[Tag.objects.first().pk]
+            ),
+            'ingredients-list': reverse('ingredients-list'),
+            'ingredients-detail': reverse(
+                'ingredients-detail', args=[Ingredient.objects.first().pk]
+            ),
+            'users-list': reverse('users-list'),
+            'users-detail': reverse('users-detail', args=[recipe.author_id]),
+            'users-me': reverse('users-me'),
+            'users-subscriptions': reverse('users-subscriptions'),
+            'recipe-list': reverse('recipe-list'),
+            'recipe-detail': reverse('recipe-detail', args=[recipe.pk]),
+            'recipe-get-short-link': reverse(
+                'recipe-get-short-link', args=[recipe.pk]
+            ),
+            'recipe-download-cart': reverse('recipe-download-cart'),
+            'recipe-feed': reverse('recipe-feed'),
+        }
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'limit': 100})
+        self.assertEqual(response.status_code, 200, url)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, name):
+        self.seed(1)
+        small = self.count_queries(self.routes()[name])
+        self.seed(5)
+        large = self.count_queries(self.routes()[name])
+        self.assertEqual(small, large, name)
+
+    def test_every_get_route_is_covered(self):
+        routes = {
+            pattern.name for pattern in v1_router.urls
+            if 'get' in getattr(pattern.callback, 'actions', {'get': None})
+        }
+        self.seed(1)
+        self.assertEqual(
+            routes - self.SKIPPED_ROUTES.keys(), set(self.routes())
+        )
+
+    def test_catalog_routes(self):
+        for name in ('api-root', 'tags-list', 'tags-detail',
+                     'ingredients-list', 'ingredients-detail'):
+            with self.subTest(route=name):
+                self.assert_constant_queries(name)
+
+    def test_user_routes(self):
+        for name in ('users-list', 'users-detail', 'users-me',
+                     'users-subscriptions'):
+            with self.subTest(route=name):
+                self.assert_constant_queries(name)
+
+    def test_recipe_routes(self):
+        for name in ('recipe-list', 'recipe-detail', 'recipe-get-short-link',
+                     'recipe-download-cart', 'recipe-feed'):
+            with self.subTest(route=name):
+                self.assert_constant_queries(name)
+
+    def test_anonymous_recipe_list(self):
+        self.seed(2)
+        response = APIClient().get(reverse('recipe-list'), {'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        for recipe in response.json()['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['is_in_shopping_cart'])
+            self.assertFalse(recipe['author']['is_subscribed'])
+
+
+class CatalogCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.create(name='абрикосы', measurement_unit='г')
+        Ingredient.objects.create(name='бананы', measurement_unit='г')
+
+    def test_repeated_request_is_served_from_cache(self):
+        url = reverse('ingredients-list')
+        self.client.get(url, {'name': 'аб'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'name': 'аб'})
+        self.assertEqual(
+            [item['name'] for item in response.data], ['абрикосы']
+        )
+
+    def test_conditional_request_returns_not_modified(self):
+        response = self.client.get(reverse('tags-list'))
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(
+            reverse('tags-list'), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_cache_is_invalidated_on_save_and_delete(self):
+        url = reverse('tags-list')
+        etag = self.client.get(url)['ETag']
+        self.tag.name = 'Обед'
+        self.tag.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'Обед')
+        self.tag.delete()
+        self.assertEqual(self.client.get(url).data, [])
+
+    def test_local_cache_with_several_workers_is_bypassed(self):
+        url = reverse('tags-list')
+        self.client.get(url)
+        # Запись в другом воркере: версия в этом процессе не меняется.
+        Tag.objects.filter(pk=self.tag.pk).update(name='Обед')
+        with override_settings(SERVER_WORKERS=2):
+            with patch('api.cache.cache.set') as cache_set:
+                response = self.client.get(url)
+        cache_set.assert_not_called()
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.data[0]['name'], 'Обед')
+
+    def test_shared_cache_with_several_workers_is_used(self):
+        url = reverse('tags-list')
+        with override_settings(SERVER_WORKERS=2), patch(
+            'api.cache.is_local_cache', return_value=False
+        ):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+        self.assertIn('ETag', response)
+        self.assertEqual(response.data[0]['name'], 'Завтрак')
+
+
+class IngredientSearchTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'Сахар', 'сахарная пудра', 'ванильный сахар', 'соль',
+                'Мука',
+            )
+        )
+        ingredient_cache.invalidate()
+
+    def search(self, value):
+        response = self.client.get(
+            reverse('ingredients-list'), {'name': value}
+        )
+        return [item['name'] for item in response.data]
+
+    def test_prefix_matches_come_before_substring_matches(self):
+        self.assertEqual(
+            self.search('САХ'),
+            ['Сахар', 'сахарная пудра', 'ванильный сахар']
+        )
+
+    def test_short_query_matches_prefix_only(self):
+        self.assertEqual(self.search('са'), ['Сахар', 'сахарная пудра'])
+        self.assertEqual(self.search('м'), ['Мука'])
+
+    def test_ordering_does_not_grow_with_matches(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'сахар {index}', measurement_unit='г')
+            for index in range(50)
+        )
+        ingredient_cache.invalidate()
+        ingredients = search_ingredients(Ingredient.objects.all(), 'сах')
+        self.assertEqual(len(ingredients), 53)
+        self.assertEqual(str(ingredients.query).count('WHEN'), 1)
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search('соль'), ['соль'])
+        Ingredient.objects.create(name='соль морская', measurement_unit='г')
+        self.assertEqual(self.search('соль'), ['соль', 'соль морская'])
+
+
+class RecipeCursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Автор', last_name='Авторов'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {index}', text='Описание',
+                   image='recipe_images/test.png', cooking_time=10)
+            for index in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_id_order_without_count(self):
+        client = APIClient()
+        response = client.get(
+            reverse('recipe-list'), {'pagination': 'cursor', 'limit': 2}
+        )
+        self.assertNotIn('count', response.json())
+        ids = []
+        while True:
+            data = response.json()
+            ids += [recipe['id'] for recipe in data['results']]
+            if data['next'] is None:
+                break
+            response = client.get(data['next'])
+        self.assertEqual(
+            ids, list(Recipe.objects.values_list('id', flat=True))
+        )
+
+    def cursor_ids(self, params):
+        client = APIClient()
+        response = client.get(reverse('recipe-list'), params)
+        ids = []
+        while True:
+            data = response.json()
+            ids += [recipe['id'] for recipe in data['results']]
+            if data['next'] is None:
+                return ids
+            response = client.get(data['next'])
+
+    def test_cursor_follows_popularity_ordering(self):
+        for recipe, favorites in zip(Recipe.objects.all(), (1, 3, 3, 0, 2)):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=favorites
+            )
+        expected = list(Recipe.objects.order_by(
+            '-favorites_count', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(self.cursor_ids({
+            'pagination': 'cursor', 'limit': 2, 'ordering': '-popularity'
+        }), expected)
+        self.assertEqual(self.cursor_ids({
+            'pagination': 'cursor', 'limit': 2, 'ordering': 'popularity'
+        }), expected[::-1])
+
+    def test_popularity_cursor_pages_through_many_ties(self):
+        # Больше offset_cutoff DRF рецептов с одинаковым счётчиком.
+        author = User.objects.get()
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {index}', text='Описание',
+                   image='recipe_images/test.png', cooking_time=10)
+            for index in range(1150)
+        )
+        Recipe.objects.filter(pk=Recipe.objects.order_by('id')[0].pk).update(
+            favorites_count=1
+        )
+        expected = list(Recipe.objects.order_by(
+            '-favorites_count', '-id'
+        ).values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            ids = self.cursor_ids({
+                'pagination': 'cursor', 'limit': 300,
+                'ordering': '-popularity'
+            })
+        self.assertEqual(ids, expected)
+        self.assertFalse(any(
+            'OFFSET' in query['sql'] for query in context.captured_queries
+        ))
+
+    def test_invalid_popularity_cursor(self):
+        response = APIClient().get(reverse('recipe-list'), {
+            'cursor': 'abc', 'ordering': 'popularity'
+        })
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_search_is_rejected(self):
+        response = APIClient().get(reverse('recipe-list'), {
+            'pagination': 'cursor', 'search': 'Рецепт'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_optional_count(self):
+        response = APIClient().get(reverse('recipe-list'), {
+            'pagination': 'cursor', 'count': 'approximate'
+        })
+        self.assertEqual(response.json()['count'], 5)
+
+    def test_limit_offset_contract_is_kept(self):
+        response = APIClient().get(
+            reverse('recipe-list'), {'limit': 2, 'offset': 2}
+        )
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class ShoppingCartDownloadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Омлет', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='яйца', measurement_unit='шт'
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=3
+        )
+        ShopCard.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('recipe-download-cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content), context
+
+    def test_repeated_download_is_not_rendered_again(self):
+        first, context = self.download()
+        self.assertTrue(first.startswith(b'%PDF'))
+        with patch('api.exports.generate_pdf') as generate_pdf:
+            second, cached_context = self.download()
+        generate_pdf.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertLess(
+            len(cached_context.captured_queries),
+            len(context.captured_queries)
+        )
+
+    def test_ingredient_changes_invalidate_document(self):
+        first, _ = self.download()
+        RecipeIngredient.objects.filter(recipe=self.recipe).update(amount=5)
+        with self.captureOnCommitCallbacks() as callbacks:
+            RecipeIngredient.objects.first().save()
+        # До коммита версия рецепта не меняется.
+        self.assertEqual(self.download()[0], first)
+        for callback in callbacks:
+            callback()
+        second, _ = self.download()
+        self.assertNotEqual(first, second)
+
+    def test_unrelated_changes_keep_document(self):
+        first, _ = self.download()
+        reader = User.objects.create(
+            email='other@foodgram.ru', username='other',
+            first_name='Другой', last_name='Читатель'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Recipe.objects.create(
+                author=reader, name='Блины', text='Описание',
+                image='recipe_images/test.png', cooking_time=10
+            )
+            RecipeIngredient.objects.create(
+                recipe=other, ingredient=self.ingredient, amount=2
+            )
+            ShopCard.objects.create(user=reader, recipe=other)
+        with patch('api.exports.generate_pdf') as generate_pdf:
+            second, _ = self.download()
+        generate_pdf.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_cart_changes_change_document(self):
+        first, _ = self.download()
+        other = Recipe.objects.create(
+            author=self.user, name='Блины', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=other, ingredient=self.ingredient, amount=2
+        )
+        ShopCard.objects.create(user=self.user, recipe=other)
+        second, _ = self.download()
+        self.assertNotEqual(first, second)
+
+    def test_text_formats_are_streamed(self):
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'type': 'txt'}
+        )
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'К закупкам!\n\n1. яйца (шт) — 3\n'
+        )
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'type': 'csv'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'name,measurement_unit,amount\r\nяйца,шт,3\r\n'
+        )
+
+    def test_json_format(self):
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'type': 'json'}
+        )
+        self.assertEqual(
+            response.json(),
+            [{'name': 'яйца', 'measurement_unit': 'шт', 'amount': 3}]
+        )
+
+    def test_type_does_not_clash_with_renderer_format(self):
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'type': 'json'},
+            HTTP_ACCEPT='text/html'
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'format': 'txt'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            reverse('recipe-download-cart'), {'type': 'docx'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PdfFontTest(TestCase):
+
+    def render(self, add):
+        pdf = FPDF()
+        pdf.set_creation_date(
+            datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        pdf.add_page()
+        add(pdf)
+        pdf.set_font('ComicSansMS', size=14)
+        pdf.cell(0, 10, format_ingredient(1, {
+            'name': 'яйца', 'measurement_unit': 'шт', 'amount': 3
+        }))
+        return bytes(pdf.output())
+
+    def test_cached_font_matches_public_api(self):
+        # Падает, если новая версия fpdf2 подключает шрифты иначе.
+        self.assertEqual(
+            self.render(lambda pdf: add_font(
+                pdf, 'ComicSansMS', 'ComicSansMS.ttf'
+            )),
+            self.render(lambda pdf: pdf.add_font(
+                'ComicSansMS', fname=str(FONTS_DIR / 'ComicSansMS.ttf')
+            ))
+        )
+
+
+class ShoppingListExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев'
+        )
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Омлет', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=3, ingredient=Ingredient.objects.create(
+                name='яйца', measurement_unit='шт'
+            )
+        )
+        ShopCard.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, SHOPPING_LIST_SYNC_LIMIT=0
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_large_cart_is_rendered_by_worker(self):
+        response = self.client.get(reverse('recipe-download-cart'))
+        self.assertEqual(response.status_code, 202)
+        url = response.data['url']
+        self.assertEqual(self.client.get(url).data['status'], 'pending')
+        call_command('process_exports', once=True, stdout=io.StringIO())
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF')
+        )
+
+    def test_repeated_request_reuses_queued_export(self):
+        url = reverse('recipe-download-cart')
+        first = self.client.get(url)
+        second = self.client.get(url)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(ShoppingListExport.objects.count(), 1)
+        call_command('process_exports', once=True, stdout=io.StringIO())
+        with patch('api.exports.generate_pdf') as generate_pdf:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        generate_pdf.assert_not_called()
+
+    def test_stalled_export_is_reclaimed(self):
+        response = self.client.get(reverse('recipe-download-cart'))
+        export = ShoppingListExport.objects.get()
+        # Воркер забрал выгрузку и упал, не успев её сформировать.
+        claim_export()
+        ShoppingListExport.objects.update(
+            started=timezone.now() - datetime.timedelta(hours=1)
+        )
+        with override_settings(SHOPPING_LIST_EXPORT_ATTEMPTS=2):
+            call_command('process_exports', once=True, stdout=io.StringIO())
+        export.refresh_from_db()
+        self.assertEqual(export.status, ShoppingListExport.DONE)
+        self.assertEqual(export.attempts, 2)
+        self.assertEqual(self.client.get(response.data['url'])['Content-Type'],
+                         'application/pdf')
+
+    def test_export_fails_after_attempts(self):
+        self.client.get(reverse('recipe-download-cart'))
+        ShoppingListExport.objects.update(
+            status=ShoppingListExport.RUNNING, attempts=3,
+            started=timezone.now() - datetime.timedelta(hours=1)
+        )
+        self.assertIsNone(claim_export())
+        self.assertEqual(ShoppingListExport.objects.get().status,
+                         ShoppingListExport.FAILED)
+
+    def test_expired_exports_and_files_are_deleted(self):
+        self.client.get(reverse('recipe-download-cart'))
+        call_command('process_exports', once=True, stdout=io.StringIO())
+        export = ShoppingListExport.objects.get()
+        path = export.file.path
+        orphan = os.path.join(os.path.dirname(path), 'orphan.pdf')
+        with open(orphan, 'wb') as file:
+            file.write(b'%PDF')
+        old = timezone.now() - datetime.timedelta(days=2)
+        os.utime(orphan, (old.timestamp(), old.timestamp()))
+        call_command('process_exports', once=True, stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(orphan))
+        ShoppingListExport.objects.update(created=old)
+        os.utime(path, (old.timestamp(), old.timestamp()))
+        call_command('process_exports', once=True, stdout=io.StringIO())
+        self.assertFalse(ShoppingListExport.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_cached_document_skips_queue(self):
+        url = reverse('recipe-download-cart')
+        with override_settings(SHOPPING_LIST_SYNC_LIMIT=10):
+            self.client.get(url)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(ShoppingListExport.objects.exists())
+
+    def test_export_of_another_user_is_hidden(self):
+        response = self.client.get(reverse('recipe-download-cart'))
+        other = User.objects.create(
+            email='other@foodgram.ru', username='other',
+            first_name='Другой', last_name='Пользователь'
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(response.data['url']).status_code,
+                         404)
+
+    def test_malformed_export_id(self):
+        for export_id in ('abc', '---', str(uuid.uuid4())[:-1]):
+            response = self.client.get(
+                f'{reverse("recipe-list")}download_shopping_cart/{export_id}/'
+            )
+            self.assertEqual(response.status_code, 404)
+
+
+class ShortLinkTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Автор', last_name='Авторов'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Омлет', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_link(self, pk):
+        return self.client.get(reverse('recipe-get-short-link', args=[pk]))
+
+    def test_link_is_stable_and_cached(self):
+        link = self.get_link(self.recipe.pk).data['short-link']
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.get_link(self.recipe.pk).data['short-link'], link
+            )
+        self.assertEqual(ShortLink.objects.count(), 1)
+        response = self.client.get(link)
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}',
+            fetch_redirect_response=False
+        )
+
+    def test_unknown_recipe_and_code(self):
+        self.assertEqual(self.get_link(self.recipe.pk + 1).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('short-link', args=['zz'])).status_code,
+            404
+        )
+
+    def test_deleted_recipe_link_stops_resolving(self):
+        link = self.get_link(self.recipe.pk).data['short-link']
+        self.recipe.delete()
+        self.assertEqual(self.client.get(link).status_code, 404)
+
+    def test_redirect_under_asgi(self):
+        link = self.get_link(self.recipe.pk).data['short-link']
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = async_to_sync(self.async_client.get)(link)
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}',
+            fetch_redirect_response=False
+        )
+
+
+class RecipeCountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Читателев'
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.user, name=f'Рецепт {index}', text='Описание',
+                   image='recipe_images/test.png', cooking_time=10)
+            for index in range(3)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_actions_maintain_counters(self):
+        recipe = self.recipes[0]
+        for name in ('recipe-favorite', 'recipe-shopping-cart'):
+            self.client.post(reverse(name, args=[recipe.pk]))
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+        for name in ('recipe-favorite', 'recipe-shopping-cart'):
+            url = reverse(name, args=[recipe.pk])
+            self.assertEqual(self.client.delete(url).status_code, 204)
+            self.assertEqual(self.client.delete(url).status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 0)
+        )
+
+    def test_admin_changes_keep_counters_in_sync(self):
+        recipe = self.recipes[1]
+        # Как в админке: строки меняются без действий API.
+        favorite = Favorite.objects.create(user=self.user, recipe=recipe)
+        ShopCard.objects.create(user=self.user, recipe=recipe)
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+        favorite.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_drifted_counter_does_not_go_negative(self):
+        recipe = self.recipes[1]
+        Favorite.objects.bulk_create([Favorite(user=self.user, recipe=recipe)])
+        response = self.client.delete(
+            reverse('recipe-favorite', args=[recipe.pk])
+        )
+        self.assertEqual(response.status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_recipe_edit_keeps_concurrent_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        # Пока рецепт правят, его добавляют в избранное и в корзину.
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=3, in_carts_count=2, fanned_out=True
+        )
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.name, recipe.favorites_count, recipe.in_carts_count,
+             recipe.fanned_out),
+            ('Новое название', 3, 2, True)
+        )
+
+    def test_popularity_ordering(self):
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(
+            favorites_count=5
+        )
+        response = self.client.get(
+            reverse('recipe-list'), {'ordering': '-popularity', 'limit': 3}
+        )
+        self.assertEqual(
+            response.data['results'][0]['id'], self.recipes[1].pk
+        )
+        response = self.client.get(
+            reverse('recipe-list'), {'ordering': 'likes'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_reconcile_command_fixes_drift(self):
+        recipe = self.recipes[2]
+        # bulk_create не отправляет сигналы, и счётчик расходится.
+        Favorite.objects.bulk_create([Favorite(user=self.user, recipe=recipe)])
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            in_carts_count=7
+        )
+        out = io.StringIO()
+        call_command('reconcile_recipe_counters', stdout=out)
+        self.assertIn('2', out.getvalue())
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', 'in_carts_count'
+            )),
+            [(0, 0), (0, 0), (1, 0)]
+        )
+
+
+class LoadCommandsTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write_json(self, name, data):
+        path = f'{self.tmp_dir}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        return path
+
+    def test_load_ingredients_is_idempotent(self):
+        version = ingredient_cache.get_version()
+        call_command('load_ingredients', stdout=io.StringIO())
+        total = Ingredient.objects.count()
+        self.assertGreater(total, 2000)
+        self.assertNotEqual(ingredient_cache.get_version(), version)
+        out = io.StringIO()
+        call_command('load_ingredients', '--batch-size', '100', stdout=out)
+        self.assertEqual(Ingredient.objects.count(), total)
+        self.assertIn('записано 0', out.getvalue())
+
+    def test_read_json_streams_items(self):
+        items = [{'name': f'ингредиент {index}'} for index in range(50)]
+        path = self.write_json('items.json', items)
+        with patch('recipes.loaders.JSON_CHUNK_SIZE', 16):
+            self.assertEqual(list(read_json(path)), items)
+
+    def test_load_recipes_skips_invalid_items(self):
+        author = User.objects.create(email='chef@foodgram.ru', username='c')
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        recipe = {
+            'author': author.email, 'name': 'Каша', 'text': 'Сварить.',
+            'cooking_time': 5, 'image': 'recipe_images/test.png',
+            'tags': ['breakfast'],
+            'ingredients': [{'name': 'соль', 'amount': 2}],
+        }
+        path = self.write_json('recipes.json', [
+            recipe,
+            dict(recipe, author='nobody@foodgram.ru'),
+            dict(recipe, tags=['dinner']),
+            dict(recipe, ingredients=[{'name': 'соль', 'amount': 0}]),
+        ])
+        out = io.StringIO()
+        call_command('load_recipes', path, '--batch-size', '2', stdout=out)
+        self.assertIn('записано 1, пропущено 3', out.getvalue())
+        loaded = Recipe.objects.get()
+        self.assertEqual(
+            list(loaded.recipe_ingredients.values_list(
+                'ingredient__name', 'amount'
+            )),
+            [('соль', 2)]
+        )
+        self.assertEqual(list(loaded.tags.values_list('slug', flat=True)),
+                         ['breakfast'])
+
+    def test_load_recipes_twice_does_not_duplicate(self):
+        author = User.objects.create(email='chef@foodgram.ru', username='c')
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        recipe = {
+            'author': author.email, 'name': 'Каша', 'text': 'Сварить.',
+            'cooking_time': 5, 'image': 'recipe_images/test.png',
+            'tags': ['breakfast'],
+            'ingredients': [{'name': 'соль', 'amount': 2}],
+        }
+        path = self.write_json('recipes.json', [
+            recipe, dict(recipe, name='Суп'), dict(recipe, text='Другой.')
+        ])
+        out = io.StringIO()
+        call_command('load_recipes', path, stdout=out)
+        self.assertIn('записано 2, пропущено 1', out.getvalue())
+        counts = (Recipe.objects.count(), RecipeIngredient.objects.count(),
+                  RecipeTag.objects.count())
+        self.assertEqual(counts, (2, 2, 2))
+        out = io.StringIO()
+        call_command('load_recipes', path, stdout=out)
+        self.assertIn('записано 0, пропущено 3', out.getvalue())
+        self.assertEqual(
+            (Recipe.objects.count(), RecipeIngredient.objects.count(),
+             RecipeTag.objects.count()),
+            counts
+        )
+
+
+class BenchmarkCommandsTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        call_command(
+            'seed_data', '--users', '5', '--recipes', '20', '--tags', '3',
+            '--ingredients', '30', '--favorites', '3', '--carts', '2',
+            '--subscriptions', '2', stdout=io.StringIO()
+        )
+
+    def run_benchmark(self, *args):
+        out = io.StringIO()
+        call_command(
+            'run_benchmark', '--requests', '3', '--warmup', '1',
+            '--baseline', f'{self.tmp_dir}/baseline.json', *args,
+            stdout=out
+        )
+        return out.getvalue()
+
+    def test_seed_data(self):
+        reader = User.objects.get(email='reader@bench.foodgram.ru')
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(reader.favorites.count(), 3)
+        self.assertEqual(reader.subscriber.count(), 2)
+        self.assertEqual(
+            Recipe.objects.get(pk=reader.favorites.first().recipe_id)
+            .favorites_count,
+            Favorite.objects.filter(
+                recipe=reader.favorites.first().recipe
+            ).count()
+        )
+
+    def test_compare_renderers(self):
+        out = io.StringIO()
+        call_command('compare_renderers', '--recipes', '5', '--rounds', '2',
+                     stdout=out)
+        self.assertIn('Страница: 5 рецептов', out.getvalue())
+        self.assertIn('render', out.getvalue())
+
+    def test_query_regression_fails_run(self):
+        self.assertIn('Базовый прогон записан',
+                      self.run_benchmark('--save-baseline'))
+        with open(f'{self.tmp_dir}/baseline.json') as file:
+            baseline = json.load(file)
+        self.assertEqual(
+            set(baseline['recipe_detail']),
+            {'p50', 'p95', 'p99', 'rps', 'queries'}
+        )
+        self.assertIn('Регрессий нет',
+                      self.run_benchmark('--tolerance', '1000'))
+        baseline['recipe_detail']['queries'] -= 1
+        with open(f'{self.tmp_dir}/baseline.json', 'w') as file:
+            json.dump(baseline, file)
+        with self.assertRaisesMessage(CommandError, 'recipe_detail'):
+            self.run_benchmark('recipe_detail', '--tolerance', '1000')
+
+
+class ProfilingMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='p@foodgram.ru', username='p')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self):
+        return APIClient().get(
+            reverse('recipe-detail', args=[self.recipe.pk])
+        )
+
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.get())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_server_timing_and_log(self):
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            response = self.get()
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=',
+                       'total;dur='):
+            self.assertIn(metric, timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'recipe-detail')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertEqual(record['duplicates'], [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_async_request_path(self):
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            response = async_to_sync(self.async_client.get)(
+                reverse('recipe-detail', args=[self.recipe.pk])
+            )
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertGreater(
+            json.loads(logs.records[0].getMessage())['db_queries'], 0
+        )
+
+    def test_duplicate_queries(self):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile.record_query):
+            for pk in range(3):
+                User.objects.filter(pk=pk).exists()
+        duplicates = profile.duplicates(threshold=3)
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0]['count'], 3)
+        self.assertEqual(profile.duplicates(threshold=4), [])
+
+
+class MetricsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_route_latency_and_queries(self):
+        labels = {'route': 'tags', 'method': 'GET', 'status': '2xx'}
+        requests = self.sample(
+            'foodgram_request_duration_seconds_count', **labels
+        )
+        queries = self.sample('foodgram_db_queries_total', route='tags')
+        cache.clear()
+        self.client.get(reverse('tags-list'))
+        self.assertEqual(
+            self.sample('foodgram_request_duration_seconds_count', **labels),
+            requests + 1
+        )
+        self.assertGreater(
+            self.sample('foodgram_db_queries_total', route='tags'), queries
+        )
+
+    def test_async_request_path(self):
+        labels = {'route': 'tags', 'method': 'GET', 'status': '2xx'}
+        requests = self.sample(
+            'foodgram_request_duration_seconds_count', **labels
+        )
+        queries = self.sample('foodgram_db_queries_total', route='tags')
+        cache.clear()
+        response = async_to_sync(self.async_client.get)(reverse('tags-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.sample('foodgram_request_duration_seconds_count', **labels),
+            requests + 1
+        )
+        self.assertGreater(
+            self.sample('foodgram_db_queries_total', route='tags'), queries
+        )
+
+    def test_new_db_connections(self):
+        opened = self.sample(
+            'foodgram_db_connections_opened_total', alias='default'
+        )
+        connection_created.send(
+            sender=connection.__class__, connection=connection
+        )
+        self.assertEqual(
+            self.sample('foodgram_db_connections_opened_total',
+                        alias='default'),
+            opened + 1
+        )
+
+    def test_catalog_cache_hits(self):
+        hits = self.sample(
+            'foodgram_cache_requests_total', cache='tags_local', result='hit'
+        )
+        self.client.get(reverse('tags-list'))
+        self.client.get(reverse('tags-list'))
+        self.assertGreater(
+            self.sample('foodgram_cache_requests_total',
+                        cache='tags_local', result='hit'),
+            hits
+        )
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('tags-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'foodgram_request_duration_seconds_bucket{', response.content
+        )
+        self.assertIn(b'route="tags"', response.content)
+
+    def test_metrics_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                             403)
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_service_dirs_are_merged_and_cleared(self):
+        directories = [tempfile.mkdtemp() for _ in range(2)]
+        for directory in directories:
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+            values = MmapedDict(os.path.join(directory, 'counter_host-1.db'))
+            values.write_value(mmap_key(
+                'foodgram_shopping_list_exports',
+                'foodgram_shopping_list_exports_total', ['status'], ['done'],
+                'Выгрузки.'
+            ), 1.0, 0)
+            values.close()
+        with patch.dict(os.environ, {
+            'PROMETHEUS_MULTIPROC_DIR': directories[0],
+            'METRICS_EXTRA_DIRS': directories[1],
+        }):
+            response = self.client.get(reverse('metrics'))
+        self.assertIn(
+            b'foodgram_shopping_list_exports_total{status="done"} 2.0',
+            response.content
+        )
+        clear_metrics_dir(directories[0])
+        self.assertEqual(os.listdir(directories[0]), [])
+
+
+class FeedTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(email='r@foodgram.ru', username='r')
+        cls.author = User.objects.create(email='a@foodgram.ru', username='a')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def publish(self, author, name='Рецепт'):
+        client = APIClient()
+        client.force_authenticate(author)
+        response = client.post(reverse('recipe-list'), {
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+            'name': name, 'text': 'Описание', 'cooking_time': 5,
+            'image': SMALL_GIF,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def feed(self, **params):
+        response = self.client.get(reverse('recipe-feed'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def feed_ids(self, **params):
+        return [recipe['id'] for recipe in self.feed(**params)['results']]
+
+    def test_fan_out_on_write(self):
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        recipe_id = self.publish(self.author)
+        self.assertTrue(Recipe.objects.get(pk=recipe_id).fanned_out)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, recipe_id=recipe_id
+        ).exists())
+        self.assertEqual(self.feed_ids(), [recipe_id])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_large_author_is_read_on_request(self):
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        recipe_id = self.publish(self.author)
+        self.assertFalse(Recipe.objects.get(pk=recipe_id).fanned_out)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), [recipe_id])
+
+    def test_subscription_changes_feed(self):
+        recipe_id = self.publish(self.author)
+        self.assertEqual(self.feed_ids(), [])
+        subscription = Subscribe.objects.create(
+            user=self.reader, author=self.author
+        )
+        self.assertEqual(self.feed_ids(), [recipe_id])
+        subscription.delete()
+        self.assertEqual(self.feed_ids(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_keyset_pages_merge_both_sources(self):
+        other = User.objects.create(email='o@foodgram.ru', username='o')
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        Subscribe.objects.create(user=self.reader, author=other)
+        recipe_ids = [self.publish(self.author, f'Рецепт {index}')
+                      for index in range(3)]
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            recipe_ids += [self.publish(other, f'Рецепт {index}')
+                           for index in range(2)]
+        first = self.feed(limit=3)
+        self.assertEqual(
+            [recipe['id'] for recipe in first['results']],
+            sorted(recipe_ids, reverse=True)[:3]
+        )
+        second = self.client.get(first['next']).data
+        self.assertEqual(
+            [recipe['id'] for recipe in second['results']],
+            sorted(recipe_ids, reverse=True)[3:]
+        )
+        self.assertIsNone(second['next'])
+        response = self.client.get(reverse('recipe-feed'), {'cursor': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(email='s@foodgram.ru', username='s')
+        cls.soup, cls.pie, cls.salad = Recipe.objects.bulk_create(
+            Recipe(author=author, name=name, text=text,
+                   image='recipe_images/test.png', cooking_time=10)
+            for name, text in (
+                ('суп', 'варить час'),
+                ('пирог', 'печь в духовке'),
+                ('салат', 'нарезать'),
+            )
+        )
+        cucumber = Ingredient.objects.create(
+            name='огурцы', measurement_unit='г'
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.salad, ingredient=cucumber, amount=2
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, value):
+        response = APIClient().get(
+            reverse('recipe-list'), {'search': value, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.json()['results']}
+
+    def test_search_by_name_text_and_ingredient(self):
+        self.assertEqual(self.search('суп'), {self.soup.pk})
+        self.assertEqual(self.search('духовк'), {self.pie.pk})
+        self.assertEqual(self.search('огурц'), {self.salad.pk})
+        self.assertEqual(self.search('борщ'), set())
+
+    def test_any_recipe_save_updates_search_vector(self):
+        with patch('api.signals.update_search_vectors') as update:
+            self.soup.name = 'борщ'
+            self.soup.save()
+        # Как при сохранении из админки: вектор пересчитывается по id.
+        update.assert_called_once()
+        self.assertEqual(
+            list(update.call_args.args[0].values_list('pk', flat=True)),
+            [self.soup.pk]
+        )
+        with patch('api.signals.update_search_vectors') as update:
+            self.soup.save(update_fields=['cooking_time'])
+        update.assert_not_called()
+
+    def test_explicit_ordering_wins_over_rank(self):
+        Recipe.objects.filter(pk=self.soup.pk).update(favorites_count=5)
+        Recipe.objects.filter(pk=self.salad.pk).update(favorites_count=2)
+        response = APIClient().get(reverse('recipe-list'), {
+            'search': 'р', 'ordering': '-popularity', 'limit': 10
+        })
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.soup.pk, self.salad.pk, self.pie.pk]
+        )
+        # На PostgreSQL релевантность лишь разбивает равенство.
+        with patch('api.filters.search_recipes', lambda queryset, value: (
+            queryset.alias(rank=Value(1)).order_by('-rank', '-id')
+        )):
+            filterset = RecipeFilter(
+                {'search': 'суп', 'ordering': 'popularity'},
+                Recipe.objects.all()
+            )
+            self.assertEqual(
+                filterset.qs.query.order_by,
+                ('favorites_count', '-rank', 'id')
+            )
+
+
+class RecipeMatcherTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(email='m@foodgram.ru', username='m')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(5)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {index}', text='Описание',
+                   image='recipe_images/test.png', cooking_time=10)
+            for index in range(3)
+        )
+        first, second, third = cls.recipes
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=cls.ingredients[index],
+                             amount=1)
+            for recipe, indexes in ((first, (0, 1)), (second, (0, 1, 2, 3)),
+                                    (third, (2,)))
+            for index in indexes
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.matcher = RecipeMatcher()
+        patcher = patch('api.views.recipe_matcher', self.matcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def match(self, *indexes, **params):
+        return APIClient().get(reverse('recipe-what-to-cook'), {
+            'ingredients': [self.ingredients[index].pk for index in indexes],
+            **params
+        })
+
+    def test_ranked_by_coverage_with_missing(self):
+        response = self.match(0, 1)
+        self.assertEqual(response.status_code, 200)
+        first, second, _ = self.recipes
+        self.assertEqual(
+            [(item['id'], item['coverage'],
+              [missing['id'] for missing in item['missing']])
+             for item in response.data],
+            [(first.pk, 1.0, []),
+             (second.pk, 0.5, [self.ingredients[2].pk,
+                               self.ingredients[3].pk])]
+        )
+        self.assertEqual(len(self.match(0, 1, limit=1).data), 1)
+
+    def test_invalid_query(self):
+        self.assertEqual(self.match().status_code, 400)
+        response = APIClient().get(
+            reverse('recipe-what-to-cook'), {'ingredients': 'соль'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_update(self):
+        self.match(4)
+        third = self.recipes[2]
+        with patch.object(self.matcher, 'build') as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                RecipeIngredient.objects.create(
+                    recipe=third, ingredient=self.ingredients[4], amount=1
+                )
+            response = self.match(4)
+        build.assert_not_called()
+        self.assertEqual(
+            [(item['id'], item['coverage']) for item in response.data],
+            [(third.pk, 0.5)]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            third.delete()
+        self.assertEqual(self.match(4).data, [])
+
+    def test_change_committed_out_of_order(self):
+        self.match(4)
+        last = RecipeChange.objects.aggregate(last=Max('id'))['last'] or 0
+        first, _, third = self.recipes
+        RecipeChange.objects.create(id=last + 10, recipe_id=first.pk)
+        bump_version(MATCHING_VERSION_KEY)
+        self.match(4)
+        # Транзакция с меньшим id закоммитилась после прочитанной записи.
+        RecipeIngredient.objects.bulk_create([RecipeIngredient(
+            recipe=third, ingredient=self.ingredients[4], amount=1
+        )])
+        RecipeChange.objects.create(id=last + 5, recipe_id=third.pk)
+        bump_version(MATCHING_VERSION_KEY)
+        with patch.object(self.matcher, 'build') as build:
+            response = self.match(4)
+        build.assert_not_called()
+        self.assertEqual([item['id'] for item in response.data], [third.pk])
+
+    def test_queries_do_not_depend_on_catalog(self):
+        self.match(0)
+        with CaptureQueriesContext(connection) as context:
+            self.match(0, 1, 2)
+        self.assertEqual(len(context), 2)
+
+
+class RecipeResponseCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(email='a@foodgram.ru', username='a')
+        cls.reader = User.objects.create(email='r@foodgram.ru', username='r')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipe_images/test.png', cooking_time=10
+        )
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipe)
+        Subscribe.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.detail = reverse('recipe-detail', args=[self.recipe.pk])
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_anonymous_response_is_cached_with_etag(self):
+        client = APIClient()
+        first = client.get(self.detail)
+        with self.assertNumQueries(0):
+            second = client.get(self.detail)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        with self.assertNumQueries(0):
+            response = client.get(
+                self.detail, HTTP_IF_NONE_MATCH=first['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_local_cache_with_several_workers_is_bypassed(self):
+        client = APIClient()
+        client.get(self.detail)
+        with override_settings(SERVER_WORKERS=2):
+            with patch('api.cache.cache.set') as cache_set:
+                response = client.get(self.detail)
+                client.get(reverse('recipe-list'))
+        cache_set.assert_not_called()
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.data['id'], self.recipe.pk)
+
+    def test_update_changes_version(self):
+        client = APIClient()
+        etag = client.get(reverse('recipe-list'))['ETag']
+        author = APIClient()
+        author.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = author.patch(self.detail, {
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 3}],
+                'name': 'Новый рецепт', 'text': 'Описание',
+                'cooking_time': 5, 'image': SMALL_GIF,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        response = client.get(
+            reverse('recipe-list'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Новый рецепт')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(client.get(reverse('recipe-list')).json(), [])
+
+    def test_user_flags_are_applied_over_cached_body(self):
+        APIClient().get(self.detail)
+        reader = APIClient()
+        reader.force_authenticate(self.reader)
+        self.assertTrue(
+            reader.get(reverse('recipe-list')).data[0]['is_favorited']
+        )
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        response = client.get(self.detail)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertFalse(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(
+            client.get(
+                self.detail, HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code, 304
+        )
+        Favorite.objects.filter(user=self.reader).delete()
+        response = client.get(
+            self.detail, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertFalse(
+            APIClient().get(self.detail).json()['is_favorited']
+        )
+
+    def test_page_serializes_only_missing_fragments(self):
+        # Фильтр по корзине обходит кеш ответов, и страница собирается
+        # из фрагментов с флагами каждого пользователя.
+        params = {'is_in_shopping_cart': 0, 'limit': 10}
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as cold:
+            first = client.get(reverse('recipe-list'), params)
+        with CaptureQueriesContext(connection) as warm:
+            second = client.get(reverse('recipe-list'), params)
+        self.assertEqual(len(warm), len(cold) - 3)
+        self.assertEqual(second.data, first.data)
+        recipe = second.data['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        other = APIClient()
+        other.force_authenticate(self.author)
+        recipe = other.get(reverse('recipe-list'), params).data['results'][0]
+        self.assertFalse(recipe['is_favorited'])
+        self.assertFalse(recipe['author']['is_subscribed'])
+        self.recipe.name = 'Новый рецепт'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(
+            client.get(reverse('recipe-list'), params).data['results'][0][
+                'name'
+            ],
+            'Новый рецепт'
+        )
+
+
+class RenderersTest(TestCase):
+    PAYLOAD = {
+        'text': ''.join(map(chr, range(128))) + 'Щи «суп» \u2028\u2029 😀',
+        'nested': [{'id': 1, 'amount': 2.5, 'ok': True, 'none': None}],
+        1: 'целый ключ',
+        'detail': ErrorDetail('Ошибка.', code='invalid'),
+        'lazy': gettext_lazy('Отмена'),
+        'created': datetime.datetime(
+            2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc
+        ),
+        'date': datetime.date(2024, 5, 1),
+        'decimal': decimal.Decimal('1.50'),
+        'uuid': uuid.UUID(int=1),
+        'tags': {'breakfast'},
+        'big': 2 ** 70,
+    }
+
+    def test_output_matches_json_renderer(self):
+        for data in (self.PAYLOAD, {'big': 2 ** 64}, [], None):
+            for media_type in ('application/json',
+                               'application/json; indent=4'):
+                with self.subTest(data=data, media_type=media_type):
+                    self.assertEqual(
+                        ORJSONRenderer().render(data, media_type),
+                        JSONRenderer().render(data, media_type)
+                    )
+
+    def test_falls_back_without_orjson(self):
+        with patch('api.renderers.orjson', None):
+            self.assertEqual(
+                ORJSONRenderer().render(self.PAYLOAD),
+                JSONRenderer().render(self.PAYLOAD)
+            )
+            self.assertEqual(
+                ORJSONParser().parse(io.BytesIO(b'{"id": 1}')), {'id': 1}
+            )
+
+    def test_api_response_matches_json_renderer(self):
+        Tag.objects.create(name='Завтрак\u2028', slug='breakfast')
+        response = self.client.get(reverse('tags-list'))
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(json.loads(response.content))
+        )
+
+    def test_parser_matches_json_parser(self):
+        for content in (
+            '{"name": "Щи", "amount": 1.5, "tags": [1, 2]}'.encode(),
+            b'{"big": 100000000000000000000000}',
+            b'"\\ud800"',
+        ):
+            with self.subTest(content=content):
+                self.assertEqual(
+                    ORJSONParser().parse(io.BytesIO(content)),
+                    JSONParser().parse(io.BytesIO(content))
+                )
+        for content in (b'{"name": }', b'NaN', b'\xff'):
+            with self.subTest(content=content):
+                with self.assertRaises(ParseError) as expected:
+                    JSONParser().parse(io.BytesIO(content))
+                with self.assertRaisesMessage(
+                    ParseError, str(expected.exception)
+                ):
+                    ORJSONParser().parse(io.BytesIO(content))
@@ -1,31 +1,97 @@
+import copy
+import csv
 import io
+from functools import lru_cache
+from pathlib import Path
 
+from fontTools import ttLib
 from fpdf import FPDF
 
+try:
+    from fpdf.fonts import SubsetMap, TTFFont
+except ImportError:
+    SubsetMap = TTFFont = None
+
+FONTS_DIR = Path(__file__).resolve().parent.parent / 'recipes' / 'fonts'
+
+
+@lru_cache(maxsize=None)
+def load_font(file_name):
+    path = FONTS_DIR / file_name
+    return TTFFont(FPDF(), path, path.stem.lower(), ''), path.read_bytes()
+
+
+def add_font(pdf, family, file_name):
+    """Подключает шрифт к документу без повторного разбора TTF-файла.
+
+    Метрики и таблица символов разбираются один раз на процесс. Свой
+    экземпляр TTFont документу всё равно нужен: при выводе fpdf2 урезает
+    его до использованных глифов. Код повторяет FPDF.add_font версии из
+    requirements.txt; тест сравнивает PDF с результатом публичного API,
+    а без внутренних классов fpdf2 используется сам FPDF.add_font.
+    """
+    if TTFFont is None:
+        pdf.add_font(family, fname=str(FONTS_DIR / file_name))
+        return
+    template, data = load_font(file_name)
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.fontkey = family.lower()
+    font.ttfont = ttLib.TTFont(
+        io.BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True
+    )
+    font.missing_glyphs = []
+    identities = '\x00 \r\n'
+    if pdf.str_alias_nb_pages:
+        identities += '0123456789' + pdf.str_alias_nb_pages
+    font.subset = SubsetMap(font, [ord(char) for char in identities])
+    pdf.fonts[font.fontkey] = font
+
+
+SHOPPING_LIST_TITLE = 'К закупкам!'
+SHOPPING_LIST_FIELDS = ('name', 'measurement_unit', 'amount')
+
+
+def format_ingredient(index, ingredient):
+    return (f"{index}. {ingredient['name']} "
+            f"({ingredient['measurement_unit']}) — {ingredient['amount']}")
+
+
+def generate_text(ingredients):
+    yield f'{SHOPPING_LIST_TITLE}\n\n'
+    for index, ingredient in enumerate(ingredients, start=1):
+        yield format_ingredient(index, ingredient) + '\n'
+
+
+class Echo:
+    """Псевдобуфер: csv.writer возвращает строку вместо записи в файл."""
+
+    def write(self, value):
+        return value
+
+
+def generate_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_FIELDS)
+    for ingredient in ingredients:
+        yield writer.writerow(
+            [ingredient[field] for field in SHOPPING_LIST_FIELDS]
+        )
+
 
 def generate_pdf(ingredients):
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
-    pdf.add_font(
-        'ComicSansMS', '',
-        'recipes/fonts/ComicSansMS.ttf', uni=True
-    )
-    pdf.add_font(
-        'ComicSansMSB', '',
-        'recipes/fonts/ComicSansMSB.ttf', uni=True
-    )
+    add_font(pdf, 'ComicSansMS', 'ComicSansMS.ttf')
+    add_font(pdf, 'ComicSansMSB', 'ComicSansMSB.ttf')
     pdf.set_text_color(0, 181, 134)
     pdf.set_font("ComicSansMSB", size=25)
-    pdf.cell(0, 10, "К закупкам!", ln=True, align='C')
+    pdf.cell(0, 10, SHOPPING_LIST_TITLE, ln=True, align='C')
     pdf.set_text_color(0, 45, 143)
     pdf.set_font("ComicSansMS", size=14)
-    for index, ingredient in enumerate(ingredients):
-        name = ingredient['ingredient__name']
-        unit = ingredient['ingredient__measurement_unit']
-        amount = ingredient['amount']
-        line_text = f"{index + 1}. {name} ({unit}) — {amount}"
-        pdf.cell(0, 10, line_text, ln=True)
+    for index, ingredient in enumerate(ingredients, start=1):
+        pdf.cell(0, 10, format_ingredient(index, ingredient), ln=True)
 
     pdf_output = io.BytesIO()
     pdf.output(pdf_output)
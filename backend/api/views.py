@@ -1,18 +1,25 @@
+import io
+
 from rest_framework import viewsets
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework import status
 from rest_framework.response import Response
-from django.db.models import Sum, Exists, OuterRef
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Value
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from djoser.views import UserViewSet as DjoserUserViewSet
-import pyshorteners
 
 from api.serializers import TagSerializer, IngredientSerializer
 from recipes.models import (
     Tag, Ingredient, Recipe, Favorite,
-    ShopCard, RecipeIngredient
+    ShopCard, RecipeIngredient, ShoppingListExport
 )
 from user.models import Subscribe, User
 from api.filters import IngredientFilter, RecipeFilter
@@ -20,65 +27,158 @@ from api.permissions import IsAuthorOrReaderOrAuthenticated
 from api.serializers import (
     ShoppingCartSerializer, FavoriteSerializer,
     RecipeSerializer, RecipeMakeSerializer,
-    FavShopSerializer, CustomUserSerializer,
+    FavShopSerializer, CustomUserSerializer, RecipeMatchQuerySerializer,
+    RecipeMatchSerializer,
     SubscriptionsSerializers, RecipeSubSerializer,
-    SubscriptionActionSerializer,
+    SubscriptionActionSerializer, get_recipes_limit,
+)
+from .cache import (
+    CachedCatalogMixin, CachedRecipeMixin, ingredient_cache, tag_cache
+)
+from .exports import (
+    SHOPPING_LIST_FORMATS, build_pdf, get_cached_pdf, get_shopping_list,
+    queue_export
 )
-from .pagination import CustomLimitOffsetPagination
-from .utils import generate_pdf
+from .feed import get_feed_ids
+from .links import get_short_link_code
+from .matching import recipe_matcher
+from .pagination import (
+    CustomLimitOffsetPagination, FeedPagination, RecipePagination
+)
+from .profiling import ProfilingMixin
+from .renderers import ORJSONRenderer
+from .utils import generate_csv, generate_text
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def annotate_is_subscribed(queryset, user):
+    if user.is_anonymous:
+        return queryset.annotate(is_subscribed=Value(False))
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Subscribe.objects.filter(user=user, author=OuterRef('pk'))
+        )
+    )
+
+
+class TagViewSet(ProfilingMixin, CachedCatalogMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    catalog_cache = tag_cache
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ProfilingMixin, CachedCatalogMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+    catalog_cache = ingredient_cache
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ProfilingMixin, CachedRecipeMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     http_method_names = ['get', 'post', 'patch', 'delete']
     permission_classes = [IsAuthorOrReaderOrAuthenticated]
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Recipe.objects.select_related('author').prefetch_related(
-            'tags', 'ingredients'
-        )
-
-        if user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        user = AnonymousUser() if self.shared_body else self.request.user
+        queryset = Recipe.objects.all()
+        # Списки собирает RecipeListSerializer из кеша фрагментов и сам
+        # догружает связанные объекты только для промахов.
+        if self.action not in ('list', 'feed'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'author',
+                    queryset=annotate_is_subscribed(User.objects.all(), user)
                 ),
-                is_in_shopping_cart=Exists(
-                    ShopCard.objects.filter(user=user, recipe=OuterRef('pk'))
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                ),
+                'tags'
+            )
+
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False)
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShopCard.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_author_subscribed=Exists(
+                Subscribe.objects.filter(
+                    user=user, author=OuterRef('author')
                 )
             )
-        return queryset
+        )
 
     def get_serializer_class(self):
         if self.action == 'partial_update' or self.action == 'create':
             return RecipeMakeSerializer
         return RecipeSerializer
 
+    @action(detail=False, methods=('get',),
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = FeedPagination()
+        recipe_ids = paginator.paginate_ids(
+            lambda before, size: get_feed_ids(request.user, before, size),
+            request
+        )
+        recipes = self.get_queryset().filter(pk__in=recipe_ids)
+        serializer = self.get_serializer(recipes.order_by('-id'), many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('get',), url_path='what-to-cook')
+    def what_to_cook(self, request):
+        query = RecipeMatchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        matches = recipe_matcher.match(
+            set(query.validated_data['ingredients']),
+            query.validated_data['limit']
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        ingredients = Ingredient.objects.in_bulk(
+            {pk for _, _, missing in matches for pk in missing}
+        )
+        results = []
+        for recipe_id, coverage, missing in matches:
+            # Рецепт мог быть удалён после последней синхронизации индекса.
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(coverage, 4)
+            recipe.missing = [
+                ingredients[pk] for pk in missing if pk in ingredients
+            ]
+            results.append(recipe)
+        return Response(RecipeMatchSerializer(
+            results, many=True, context={'request': request}
+        ).data)
+
     @action(detail=True, methods=('get',), url_path='get-link')
     def get_short_link(self, request, pk):
-        shortener = pyshorteners.Shortener()
-        short_url = shortener.tinyurl.short(
-            request.build_absolute_uri()
-            .replace('/api', '')
-            .replace('/get-link/', '')
-        )
-        return Response({'short-link': short_url})
+        code = get_short_link_code(pk)
+        if code is None:
+            raise NotFound()
+        return Response({'short-link': request.build_absolute_uri(
+            reverse('short-link', args=[code])
+        )})
 
     @action(
         detail=True, methods=['post', 'delete'],
@@ -94,14 +194,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 data={'recipe': recipe.id}, context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            Favorite.objects.create(user=user, recipe=recipe)
+            # Счётчики рецепта меняют сигналы в api/signals.py в той же
+            # транзакции.
+            with transaction.atomic():
+                Favorite.objects.create(user=user, recipe=recipe)
             return Response(FavShopSerializer(
                 recipe, context={'request': request}
             ).data, status=status.HTTP_201_CREATED)
 
-        favorite = Favorite.objects.filter(user=user, recipe=recipe)
-        if favorite.exists():
-            favorite.delete()
+        with transaction.atomic():
+            deleted, _ = Favorite.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Рецепт не находится у вас в избранном.'},
@@ -122,14 +227,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 data={'recipe': recipe.id}, context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            ShopCard.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                ShopCard.objects.create(user=user, recipe=recipe)
             return Response(RecipeSubSerializer(
                 recipe, context={'request': request}
             ).data, status=status.HTTP_201_CREATED)
 
-        shop_cart = ShopCard.objects.filter(user=user, recipe=recipe)
-        if shop_cart.exists():
-            shop_cart.delete()
+        with transaction.atomic():
+            deleted, _ = ShopCard.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Рецепт не находится у вас в списке покупок.'},
@@ -143,32 +251,103 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_cart(self, request):
         user = request.user
-        rec_in_cart = ShopCard.objects.filter(user=user).prefetch_related(
-            'recipe__ingredients'
+        # Не ?format=: его DRF занимает под выбор рендерера ответа.
+        file_format = request.query_params.get('type', 'pdf')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                           + ', '.join(SHOPPING_LIST_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipe_ids = list(
+            ShopCard.objects.filter(user=user)
+            .order_by('recipe_id').values_list('recipe_id', flat=True)
         )
-        if not rec_in_cart.exists():
+        if not recipe_ids:
             return Response(
                 {"detail": "Корзина пуста"},
                 status=status.HTTP_200_OK
             )
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe__in=rec_in_cart.values_list(
-                'recipe', flat=True)
+        if file_format == 'pdf':
+            return self.download_pdf(request, recipe_ids)
+        ingredients = get_shopping_list(recipe_ids)
+        if file_format == 'json':
+            response = HttpResponse(
+                ORJSONRenderer().render(list(ingredients)),
+                content_type=SHOPPING_LIST_FORMATS[file_format]
+            )
+        else:
+            generate = (generate_text if file_format == 'txt'
+                        else generate_csv)
+            response = StreamingHttpResponse(
+                generate(ingredients.iterator()),
+                content_type=SHOPPING_LIST_FORMATS[file_format]
             )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(amount=Sum('amount'))
-        )
-        pdf_output = generate_pdf(ingredients)
-        response = HttpResponse(pdf_output, content_type='application/pdf')
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.pdf"'
+            f'attachment; filename="shopping_cart.{file_format}"'
         )
         return response
 
+    def download_pdf(self, request, recipe_ids):
+        pdf = get_cached_pdf(recipe_ids)
+        if pdf is None:
+            # Большие корзины рендерит воркер process_exports, чтобы
+            # не занимать процесс gunicorn на всё время генерации.
+            if len(recipe_ids) > settings.SHOPPING_LIST_SYNC_LIMIT:
+                export = queue_export(request.user, recipe_ids)
+                return Response(
+                    self.get_export_data(request, export),
+                    status=status.HTTP_202_ACCEPTED
+                )
+            pdf = build_pdf(recipe_ids)
+        return FileResponse(
+            io.BytesIO(pdf), as_attachment=True,
+            filename='shopping_cart.pdf',
+            content_type=SHOPPING_LIST_FORMATS['pdf']
+        )
+
+    def get_export_data(self, request, export):
+        return {
+            'id': export.pk,
+            'status': export.status,
+            'error': export.error,
+            'url': request.build_absolute_uri(
+                reverse('recipe-download-cart-export', args=[export.pk])
+            ),
+        }
 
-class CustomUserViewSet(DjoserUserViewSet):
+    @action(
+        detail=False, methods=['get'],
+        url_path=(r'download_shopping_cart/(?P<export_id>[0-9a-f]{8}-'
+                  r'[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'),
+        permission_classes=(IsAuthenticated,)
+    )
+    def download_cart_export(self, request, export_id):
+        export = get_object_or_404(
+            ShoppingListExport, pk=export_id, user=request.user
+        )
+        if export.status != ShoppingListExport.DONE:
+            return Response(
+                self.get_export_data(request, export),
+                status=(status.HTTP_200_OK
+                        if export.status == ShoppingListExport.FAILED
+                        else status.HTTP_202_ACCEPTED)
+            )
+        return FileResponse(
+            export.file.open('rb'), as_attachment=True,
+            filename='shopping_cart.pdf',
+            content_type=SHOPPING_LIST_FORMATS['pdf']
+        )
+
+
+class CustomUserViewSet(ProfilingMixin, DjoserUserViewSet):
     pagination_class = CustomLimitOffsetPagination
 
+    def get_queryset(self):
+        return annotate_is_subscribed(
+            super().get_queryset(), self.request.user
+        )
+
     def get_serializer_class(self):
         if self.action == 'create':
             return super().get_serializer_class()
@@ -234,7 +413,17 @@ class CustomUserViewSet(DjoserUserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        subscriptions = User.objects.filter(subscribing__user=user)
+        recipes = Recipe.objects.order_by('-id')
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
+        subscriptions = annotate_is_subscribed(
+            User.objects.filter(subscribing__user=user), user
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='preview_recipes')
+        ).order_by('-subscribing__id')
         pages = self.paginate_queryset(subscriptions)
         serializer = SubscriptionsSerializers(
             pages,
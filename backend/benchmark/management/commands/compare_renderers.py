@@ -0,0 +1,84 @@
+import io
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Value
+from django.test import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import ORJSONParser, ORJSONRenderer, orjson
+from api.serializers import RecipeSerializer
+from benchmark.seed import BENCH_EMAIL_DOMAIN
+from recipes.models import Recipe
+
+
+def json_parse(content):
+    return JSONParser().parse(io.BytesIO(content))
+
+
+def measure(function, rounds):
+    return timeit.timeit(function, number=rounds) / rounds * 1000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает рендеринг и разбор страницы рецептов стандартными '
+            'JSONRenderer и JSONParser DRF и их версиями на orjson и '
+            'проверяет, что результат совпадает байт в байт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100,
+            help='Сколько рецептов на странице.'
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=200,
+            help='Сколько раз рендерить и разбирать страницу.'
+        )
+
+    def handle(self, *args, **options):
+        for option in ('recipes', 'rounds'):
+            if options[option] < 1:
+                raise CommandError(f'--{option} должен быть больше нуля.')
+        recipes = list(Recipe.objects.filter(
+            author__email__endswith=f'@{BENCH_EMAIL_DOMAIN}'
+        ).annotate(
+            is_favorited=Value(False), is_in_shopping_cart=Value(False),
+            is_author_subscribed=Value(False)
+        ).order_by('id')[:options['recipes']])
+        if not recipes:
+            raise CommandError('Нет данных, сначала запустите seed_data.')
+        if orjson is None:
+            self.stdout.write(
+                'orjson не установлен, сравнивается стандартный json.'
+            )
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            data = RecipeSerializer(
+                recipes, many=True, context={'request': request}
+            ).data
+        content = JSONRenderer().render(data)
+        if ORJSONRenderer().render(data) != content:
+            raise CommandError('ORJSONRenderer отдаёт другие байты.')
+        if ORJSONParser().parse(io.BytesIO(content)) != json_parse(content):
+            raise CommandError('ORJSONParser разбирает страницу иначе.')
+        self.stdout.write(
+            f'Страница: {len(recipes)} рецептов, {len(content)} байт.'
+        )
+        for name, standard, fast in (
+            ('render', lambda: JSONRenderer().render(data),
+             lambda: ORJSONRenderer().render(data)),
+            ('parse', lambda: json_parse(content),
+             lambda: ORJSONParser().parse(io.BytesIO(content))),
+        ):
+            standard_ms = measure(standard, options['rounds'])
+            fast_ms = measure(fast, options['rounds'])
+            self.stdout.write(
+                f'{name:<8} json {standard_ms:>8.3f} мс  '
+                f'orjson {fast_ms:>8.3f} мс  '
+                f'x{standard_ms / fast_ms:.1f}'
+            )
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmark.scenarios import get_context
+from benchmark.servers import get_paths, run_load, start_server, stop_server
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = ('Поднимает gunicorn с sync- и uvicorn-воркерами на одной базе '
+            'и сравнивает их задержки и пропускную способность на '
+            'анонимных запросах чтения при большом числе клиентов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modes', nargs='*', metavar='MODE',
+            help=f'Режимы из {", ".join(MODES)}; по умолчанию оба.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=2000,
+            help='Сколько запросов на режим.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=64,
+            help='Сколько клиентов отправляют запросы одновременно.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Сколько воркеров gunicorn запускать.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=50,
+            help='Сколько запросов сделать до замеров.'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['modes']) - set(MODES)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные режимы: {", ".join(sorted(unknown))}.'
+            )
+        for option in ('requests', 'concurrency', 'workers'):
+            if options[option] < 1:
+                raise CommandError(f'--{option} должен быть больше нуля.')
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError(
+                'Серверам нужна общая база, а не SQLite в памяти.'
+            )
+        context = get_context()
+        if context is None:
+            raise CommandError('Нет данных, сначала запустите seed_data.')
+        paths = get_paths(context)
+        for mode in options['modes'] or MODES:
+            try:
+                process, port = start_server(mode, options['workers'])
+            except RuntimeError as error:
+                raise CommandError(str(error))
+            try:
+                if options['warmup']:
+                    run_load(port, paths, options['warmup'],
+                             options['concurrency'])
+                result = run_load(port, paths, options['requests'],
+                                  options['concurrency'])
+            finally:
+                stop_server(process)
+            self.stdout.write(
+                '{mode:<6} p50 {p50:>8} мс  p95 {p95:>8} мс  '
+                'p99 {p99:>8} мс  {rps:>8} rps  {errors:>5} ошибок'
+                .format(mode=mode, **result)
+            )
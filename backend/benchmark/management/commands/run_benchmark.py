@@ -0,0 +1,90 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from benchmark.scenarios import SCENARIOS, compare, get_context, run_scenario
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p95/p99, пропускную способность и число запросов '
+            'к базе горячих эндпоинтов через тестовый клиент и сравнивает '
+            'их с сохранённым прогоном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='SCENARIO',
+            help=f'Сценарии из {", ".join(SCENARIOS)}; по умолчанию все.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Сколько замеряемых запросов на сценарий.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Сколько запросов сделать до замеров.'
+        )
+        parser.add_argument(
+            '--baseline', default=str(DEFAULT_BASELINE),
+            help='JSON с результатами прошлого прогона.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно базового прогона.'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как новый базовый прогон.'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}.'
+            )
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше нуля.')
+        context = get_context()
+        if context is None:
+            raise CommandError('Нет данных, сначала запустите seed_data.')
+        client = APIClient()
+        client.force_authenticate(context['reader'])
+        results = {}
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name in options['scenarios'] or SCENARIOS:
+                try:
+                    results[name] = run_scenario(
+                        SCENARIOS[name], client, context,
+                        options['requests'], options['warmup']
+                    )
+                except RuntimeError as error:
+                    raise CommandError(str(error))
+                self.stdout.write(
+                    '{name:<24} p50 {p50:>8} мс  p95 {p95:>8} мс  '
+                    'p99 {p99:>8} мс  {rps:>8} rps  {queries:>6} запросов'
+                    .format(name=name, **results[name])
+                )
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f'Базовый прогон записан в {baseline_path}.')
+            return
+        if not baseline_path.exists():
+            self.stdout.write('Базового прогона нет, сравнение пропущено.')
+            return
+        regressions = compare(
+            results, json.loads(baseline_path.read_text()),
+            options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write('Регрессий нет.')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from benchmark.seed import READER_EMAIL, clear, seed
+
+SEED_OPTIONS = {
+    'users': 200,
+    'recipes': 2000,
+    'tags': 10,
+    'ingredients': 500,
+    'favorites': 10,
+    'carts': 5,
+    'subscriptions': 10,
+}
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами и '
+            'связями для бенчмарков.')
+
+    def add_arguments(self, parser):
+        for name, default in SEED_OPTIONS.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать (по умолчанию {default}); для '
+                     f'избранного, корзин и подписок — на пользователя.'
+            )
+        parser.add_argument(
+            '--random-seed', type=int, default=0,
+            help='Зерно генератора случайных чисел.'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Сначала удалить ранее сгенерированные данные.'
+        )
+
+    def handle(self, *args, **options):
+        if any(options[name] < 0 for name in SEED_OPTIONS):
+            raise CommandError('Количества не могут быть отрицательными.')
+        if options['clear']:
+            clear()
+        try:
+            seed(random_seed=options['random_seed'],
+                 **{name: options[name] for name in SEED_OPTIONS})
+        except IntegrityError as error:
+            raise CommandError(
+                f'Не удалось заполнить базу: {error}. Если данные уже '
+                f'сгенерированы, запустите команду с --clear.'
+            )
+        self.stdout.write(
+            f'Создано {options["users"]} пользователей и '
+            f'{options["recipes"]} рецептов; читатель для сценариев — '
+            f'{READER_EMAIL}.'
+        )
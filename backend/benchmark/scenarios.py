@@ -0,0 +1,129 @@
+import statistics
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from benchmark.seed import (
+    BENCH_EMAIL_DOMAIN, BENCH_PREFIX, INGREDIENT_WORDS, READER_EMAIL
+)
+from recipes.models import Recipe, Tag
+from user.models import User
+
+
+def get_context():
+    """Читатель и объекты, к которым обращаются сценарии."""
+    reader = User.objects.filter(email=READER_EMAIL).first()
+    recipe = Recipe.objects.filter(
+        author__email__endswith=f'@{BENCH_EMAIL_DOMAIN}'
+    ).order_by('id').first()
+    tag = Tag.objects.filter(
+        slug__startswith=f'{BENCH_PREFIX}-'
+    ).order_by('id').first()
+    if reader is None or recipe is None or tag is None:
+        return None
+    return {'reader': reader, 'recipe': recipe.pk, 'tag': tag.slug}
+
+
+def recipe_list_by_tag(client, context, iteration):
+    return client.get(reverse('recipe-list'),
+                      {'tags': context['tag'], 'limit': 6})
+
+
+def recipe_list_favorited(client, context, iteration):
+    return client.get(reverse('recipe-list'),
+                      {'is_favorited': 1, 'limit': 6})
+
+
+def recipe_detail(client, context, iteration):
+    return client.get(reverse('recipe-detail', args=[context['recipe']]))
+
+
+def subscriptions(client, context, iteration):
+    return client.get(reverse('users-subscriptions'),
+                      {'limit': 6, 'recipes_limit': 3})
+
+
+def cart_download(client, context, iteration):
+    return client.get(reverse('recipe-download-cart'), {'type': 'txt'})
+
+
+def ingredient_search(client, context, iteration):
+    word = INGREDIENT_WORDS[iteration % len(INGREDIENT_WORDS)]
+    return client.get(reverse('ingredients-list'),
+                      {'name': f'{BENCH_PREFIX} {word}'})
+
+
+SCENARIOS = {
+    'recipe_list_by_tag': recipe_list_by_tag,
+    'recipe_list_favorited': recipe_list_favorited,
+    'recipe_detail': recipe_detail,
+    'subscriptions': subscriptions,
+    'cart_download': cart_download,
+    'ingredient_search': ingredient_search,
+}
+
+
+def percentile(samples, percent):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[
+        percent - 1
+    ]
+
+
+def run_scenario(scenario, client, context, requests, warmup):
+    """Прогоняет сценарий и возвращает задержки в мс и число запросов."""
+    for iteration in range(warmup):
+        scenario(client, context, iteration)
+    latencies = []
+    queries = 0
+    started = time.perf_counter()
+    for iteration in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = scenario(client, context, iteration)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append(
+                (time.perf_counter() - request_started) * 1000
+            )
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{scenario.__name__}: ответ {response.status_code}.'
+            )
+        queries += len(captured)
+    elapsed = time.perf_counter() - started
+    return {
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+        'rps': round(requests / elapsed, 1),
+        'queries': round(queries / requests, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно сохранённого прогона.
+
+    p95 сравнивается с допуском tolerance (p99 на сотнях запросов слишком
+    шумный), а число запросов к базе от машины не зависит и не должно
+    расти вовсе.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(
+                f'{name}: запросов {result["queries"]} '
+                f'вместо {expected["queries"]}'
+            )
+        limit = expected['p95'] * (1 + tolerance)
+        if result['p95'] > limit:
+            regressions.append(
+                f'{name}: p95 {result["p95"]} мс больше {limit:.3f} мс'
+            )
+    return regressions
@@ -0,0 +1,141 @@
+import io
+import random
+
+from django.core.management import call_command
+from django.db import transaction
+
+from api.cache import bump_recipe_versions, ingredient_cache
+from api.matching import log_recipe_changes
+from api.search import update_search_vectors
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShopCard, Tag
+)
+from user.models import Subscribe, User
+
+# Все сгенерированные строки помечены префиксом, чтобы их можно было
+# найти и удалить, не трогая настоящие данные.
+BENCH_PREFIX = 'bench'
+BENCH_EMAIL_DOMAIN = 'bench.foodgram.ru'
+READER_EMAIL = f'reader@{BENCH_EMAIL_DOMAIN}'
+INGREDIENT_WORDS = (
+    'мука', 'сахар', 'соль', 'молоко', 'масло', 'яйца', 'рис', 'гречка',
+    'томаты', 'лук', 'морковь', 'картофель', 'сыр', 'курица', 'говядина',
+)
+UNITS = ('г', 'мл', 'шт.', 'ст. л.')
+BATCH_SIZE = 2000
+
+
+def clear():
+    """Удаляет сгенерированных пользователей, тэги и ингредиенты."""
+    User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+    Tag.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').delete()
+    Ingredient.objects.filter(name__startswith=f'{BENCH_PREFIX} ').delete()
+    ingredient_cache.invalidate()
+    log_recipe_changes([None])
+
+
+def create_users(count):
+    users = [User(email=READER_EMAIL, username='reader', password='!',
+                  first_name='Читатель', last_name='Бенчмарков')]
+    users += [
+        User(email=f'author{index}@{BENCH_EMAIL_DOMAIN}',
+             username=f'author{index}', password='!',
+             first_name='Автор', last_name=str(index))
+        for index in range(count)
+    ]
+    return User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+
+def create_catalog(tags, ingredients):
+    tags = Tag.objects.bulk_create(
+        [Tag(name=f'Тэг {index}', slug=f'{BENCH_PREFIX}-{index}')
+         for index in range(tags)],
+        batch_size=BATCH_SIZE
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        [Ingredient(
+            name=' '.join((
+                BENCH_PREFIX,
+                INGREDIENT_WORDS[index % len(INGREDIENT_WORDS)],
+                str(index)
+            )),
+            measurement_unit=UNITS[index % len(UNITS)]
+        ) for index in range(ingredients)],
+        batch_size=BATCH_SIZE
+    )
+    return tags, ingredients
+
+
+def create_recipes(rng, authors, count, tags, ingredients):
+    recipes = Recipe.objects.bulk_create(
+        [Recipe(author=rng.choice(authors), name=f'Рецепт {index}',
+                text='Смешать и приготовить.',
+                image='recipe_images/bench.png',
+                cooking_time=rng.randint(5, 120))
+         for index in range(count)],
+        batch_size=BATCH_SIZE
+    )
+    RecipeIngredient.objects.bulk_create(
+        [RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                          amount=rng.randint(1, 500))
+         for recipe in recipes
+         for ingredient in rng.sample(ingredients, min(8, len(ingredients)))],
+        batch_size=BATCH_SIZE
+    )
+    RecipeTag.objects.bulk_create(
+        [RecipeTag(recipe=recipe, tag=tag)
+         for recipe in recipes
+         for tag in rng.sample(tags, min(2, len(tags)))],
+        batch_size=BATCH_SIZE
+    )
+    return recipes
+
+
+def create_relations(rng, users, recipes, favorites, carts, subscriptions):
+    """Связи для каждого пользователя; читатель получает их первым."""
+    favorite_rows, cart_rows, subscribe_rows = [], [], []
+    for user in users:
+        favorite_rows += [
+            Favorite(user=user, recipe=recipe)
+            for recipe in rng.sample(recipes, min(favorites, len(recipes)))
+        ]
+        cart_rows += [
+            ShopCard(user=user, recipe=recipe)
+            for recipe in rng.sample(recipes, min(carts, len(recipes)))
+        ]
+        authors = [author for author in rng.sample(
+            users, min(subscriptions + 1, len(users))
+        ) if author != user][:subscriptions]
+        subscribe_rows += [
+            Subscribe(user=user, author=author) for author in authors
+        ]
+    Favorite.objects.bulk_create(favorite_rows, batch_size=BATCH_SIZE)
+    ShopCard.objects.bulk_create(cart_rows, batch_size=BATCH_SIZE)
+    Subscribe.objects.bulk_create(subscribe_rows, batch_size=BATCH_SIZE)
+
+
+def seed(users, recipes, tags, ingredients, favorites, carts,
+         subscriptions, random_seed=0):
+    """Заполняет базу синтетическими данными одной транзакцией.
+
+    Генератор детерминирован при одинаковом random_seed, поэтому прогоны
+    бенчмарка на разных машинах сравнивают одинаковые наборы данных.
+    """
+    rng = random.Random(random_seed)
+    with transaction.atomic():
+        created_users = create_users(users)
+        tag_objects, ingredient_objects = create_catalog(tags, ingredients)
+        recipe_objects = create_recipes(
+            rng, created_users[1:] or created_users, recipes,
+            tag_objects, ingredient_objects
+        )
+        create_relations(rng, created_users, recipe_objects,
+                         favorites, carts, subscriptions)
+    # bulk_create не посылает сигналов: счётчики и кеши обновляются явно.
+    call_command('reconcile_recipe_counters', stdout=io.StringIO())
+    update_search_vectors(Recipe.objects.filter(
+        author__email__endswith=f'@{BENCH_EMAIL_DOMAIN}'
+    ))
+    ingredient_cache.invalidate()
+    log_recipe_changes([None])
+    bump_recipe_versions([])
@@ -0,0 +1,110 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import reverse
+
+from api.links import get_short_link_code
+from benchmark.scenarios import percentile
+from benchmark.seed import BENCH_PREFIX, INGREDIENT_WORDS
+
+HOST = '127.0.0.1'
+# Сколько секунд ждать, пока воркеры gunicorn начнут отвечать.
+START_TIMEOUT = 30
+
+
+def get_paths(context):
+    """Анонимные GET-запросы на чтение, которые чередует нагрузка."""
+    code = get_short_link_code(context['recipe'])
+    return [
+        reverse('tags-list'),
+        f'{reverse("recipe-list")}?'
+        f'{urlencode({"tags": context["tag"], "limit": 6})}',
+        reverse('recipe-detail', args=[context['recipe']]),
+        *(f'{reverse("ingredients-list")}?'
+          f'{urlencode({"name": f"{BENCH_PREFIX} {word}"})}'
+          for word in INGREDIENT_WORDS[:3]),
+        reverse('short-link', args=[code]),
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def fetch(port, path):
+    """Статус и задержка в мс одного запроса без следования редиректам."""
+    started = time.perf_counter()
+    connection = HTTPConnection(HOST, port, timeout=START_TIMEOUT)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+    finally:
+        connection.close()
+    return response.status, (time.perf_counter() - started) * 1000
+
+
+def start_server(mode, workers):
+    """Запускает gunicorn из gunicorn.conf.py в режиме wsgi или asgi."""
+    port = free_port()
+    env = {
+        **os.environ,
+        'SERVER_MODE': mode,
+        'GUNICORN_BIND': f'{HOST}:{port}',
+        'WEB_CONCURRENCY': str(workers),
+        'ALLOWED_HOSTS': ','.join([*settings.ALLOWED_HOSTS, HOST]),
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn'],
+        cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{mode}: gunicorn завершился при старте.')
+        try:
+            fetch(port, reverse('tags-list'))
+        except OSError:
+            time.sleep(0.2)
+        else:
+            return process, port
+    stop_server(process)
+    raise RuntimeError(f'{mode}: gunicorn не ответил за {START_TIMEOUT} с.')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=START_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_load(port, paths, requests, concurrency):
+    """Задержки, ошибки и пропускная способность при concurrency клиентах."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(
+            lambda index: fetch(port, paths[index % len(paths)]),
+            range(requests)
+        ))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for _, latency in results]
+    return {
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+        'rps': round(requests / elapsed, 1),
+        'errors': sum(status >= 400 for status, _ in results),
+    }
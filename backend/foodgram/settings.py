@@ -3,7 +3,7 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
-BASE_DIR = Path(file).resolve().parent.parent
+BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-gq+(t78=ax(2)5k^!lx=dx%xjm4ir11px*b*l6cg&1=w7soa+t')
 
@@ -31,9 +31,12 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'user.apps.UserConfig',
+    'benchmark.apps.BenchmarkConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,10 +74,116 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Подключение живёт DB_CONN_MAX_AGE секунд и переиспользуется
+        # следующими запросами потока; перед этим Django проверяет, что оно
+        # ещё работает. Под ASGI каждый запрос выполняется в новом потоке,
+        # и постоянные подключения только копились бы, поэтому там по
+        # умолчанию 0, а переиспользование даёт PgBouncer перед базой.
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE', 0 if os.getenv('SERVER_MODE') == 'asgi' else 60
+        )),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'True'
+        ).lower() in ('true', '1', 't'),
+        # PgBouncer в режиме transaction не сохраняет курсоры между
+        # транзакциями, и QuerySet.iterator() с ним не работает.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', 'False'
+        ).lower() in ('true', '1', 't'),
     }
 }
 
+# Версии справочников, рецептов и списков покупок должны видеть все
+# воркеры gunicorn и воркер выгрузок, поэтому кеш общий: с CACHE_LOCATION
+# (redis://cache:6379/0 в compose) это Redis. LocMemCache живёт в памяти
+# одного процесса и годится только для разработки и тестов.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache' if CACHE_LOCATION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+
+# Число воркеров gunicorn (gunicorn.conf.py читает ту же переменную).
+# С кешем в памяти процесса и несколькими воркерами ответы и фрагменты
+# рецептов не кешируются.
+SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60))
+
+# Отрендеренные ответы и сериализованные рецепты; устаревшие версии
+# просто перестают запрашиваться и вытесняются по этому сроку.
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 10 * 60))
+
+# Сколько сериализованных рецептов держит память каждого процесса.
+RECIPE_FRAGMENT_LOCAL_SIZE = int(
+    os.getenv('RECIPE_FRAGMENT_LOCAL_SIZE', 2000)
+)
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 24 * 60 * 60)
+)
+
+# Корзины с большим числом рецептов выгружаются в PDF через очередь.
+SHOPPING_LIST_SYNC_LIMIT = int(os.getenv('SHOPPING_LIST_SYNC_LIMIT', 30))
+
+# Выгрузка, которую воркер не закончил за SHOPPING_LIST_EXPORT_TIMEOUT
+# секунд, снова уходит в очередь, а после SHOPPING_LIST_EXPORT_ATTEMPTS
+# попыток считается ошибкой. Готовые выгрузки и их файлы удаляются через
+# SHOPPING_LIST_EXPORT_TTL секунд.
+SHOPPING_LIST_EXPORT_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TIMEOUT', 10 * 60)
+)
+SHOPPING_LIST_EXPORT_ATTEMPTS = int(
+    os.getenv('SHOPPING_LIST_EXPORT_ATTEMPTS', 3)
+)
+SHOPPING_LIST_EXPORT_TTL = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TTL', 24 * 60 * 60)
+)
+
+# Авторы с большим числом подписчиков не раскладывают рецепты по лентам
+# при публикации: лента дочитывает их рецепты при запросе.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+# Доля профилируемых запросов (0 — профилирование выключено) и с какого
+# повтора одинаковый SQL считается признаком N+1.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DUPLICATE_THRESHOLD = int(
+    os.getenv('PROFILING_DUPLICATE_THRESHOLD', 3)
+)
+
+# Метрики Prometheus на /metrics; между процессами gunicorn они сводятся
+# через каталог PROMETHEUS_MULTIPROC_DIR.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in (
+    'true', '1', 't'
+)
+
+# Если задан, /metrics отдаётся только с заголовком
+# Authorization: Bearer <METRICS_TOKEN>.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 AUTH_USER_MODEL = 'user.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -120,6 +229,17 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 DJOSER = {
@@ -0,0 +1,32 @@
+import os
+
+from prometheus_client import multiprocess
+
+# SERVER_MODE=asgi запускает то же приложение через uvicorn-воркеры:
+# медленные клиенты держат соединение в цикле событий, а не поток.
+SERVER_MODES = {
+    'wsgi': ('foodgram.wsgi', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+
+wsgi_app, worker_class = SERVER_MODES[os.environ.get('SERVER_MODE', 'wsgi')]
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# Django читает ту же переменную в SERVER_WORKERS.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        from api.metrics import clear_metrics_dir
+
+        clear_metrics_dir(directory)
+
+
+def child_exit(server, worker):
+    # Счётчики умершего воркера остаются в общих файлах, а его live-gauge
+    # больше не должны попадать в сумму.
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from api.metrics import process_identifier
+
+        multiprocess.mark_process_dead(process_identifier(worker.pid))
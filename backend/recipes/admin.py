@@ -17,10 +17,11 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ['author', 'name']
     readonly_fields = ['favorite_count']
     list_filter = ['tags']
-    list_display = ['name', 'get_author_name']
+    list_display = ['name', 'get_author_name', 'favorite_count']
+    list_select_related = ['author']
 
     def favorite_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
     favorite_count.short_description = 'Число добавлений в избранное'
 
     def get_author_name(self, obj):
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+DEFAULT_BATCH_SIZE = 5000
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(path, fields):
+    """Строки CSV без заголовка как словари с полями fields."""
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if row:
+                yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(path):
+    """Элементы JSON-массива по одному, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise json.JSONDecodeError('Ожидается JSON-массив', buffer, 0)
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = file.read(JSON_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def read_rows(path, fields):
+    if str(path).endswith('.json'):
+        return read_json(path)
+    return read_csv(path, fields)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class CsvStream:
+    """Файлоподобный объект для COPY: кортежи итератора в виде CSV."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+def copy_rows(model, columns, rows):
+    """Загружает кортежи через COPY во временную таблицу.
+
+    Из неё строки переносятся одним INSERT ... ON CONFLICT DO NOTHING,
+    так что повторная загрузка того же файла ничего не ломает.
+    Возвращает число вставленных строк.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(column).column)
+        for column in columns
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE import_rows ON COMMIT DROP AS '
+            f'SELECT {names} FROM {table} WITH NO DATA'
+        )
+        cursor.cursor.copy_expert(
+            f'COPY import_rows ({names}) FROM STDIN WITH (FORMAT csv)',
+            CsvStream(rows)
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({names}) SELECT {names} FROM import_rows '
+            f'ON CONFLICT DO NOTHING'
+        )
+        inserted = cursor.rowcount
+        # Внешняя транзакция может вызвать COPY ещё раз до COMMIT.
+        cursor.execute('DROP TABLE import_rows')
+    return inserted
+
+
+class Throughput:
+    """Считает строки и время загрузки для итогового отчёта."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+
+    def count(self, rows):
+        for row in rows:
+            self.read += 1
+            yield row
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (
+            f'Прочитано {self.read}, записано {self.written}, '
+            f'пропущено {self.skipped} строк за {elapsed:.2f} с '
+            f'({self.read / elapsed:.0f} строк/с).'
+        )
+
+
+class LoadCommand(BaseCommand):
+    """Общие аргументы и отчёт команд загрузки данных."""
+
+    default_path = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=self.default_path,
+            help='Файл .csv или .json.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Сколько строк записывать за один запрос.'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.'
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] is None:
+            raise CommandError('Укажите файл для загрузки.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        throughput = Throughput()
+        try:
+            self.load(options['path'], options['batch_size'], throughput)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        self.stdout.write(throughput.report())
+
+    def load(self, path, batch_size, throughput):
+        raise NotImplementedError
@@ -0,0 +1,178 @@
+import re
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredient, RecipeTag, ShopCard, Tag
+)
+from user.models import Subscribe, User
+
+# Таблицы, по которым последовательное чтение на большом наборе данных
+# означает, что запрос не попал в индекс.
+LARGE_TABLES = (
+    Recipe._meta.db_table,
+    RecipeTag._meta.db_table,
+    RecipeIngredient._meta.db_table,
+    Favorite._meta.db_table,
+    ShopCard._meta.db_table,
+    Subscribe._meta.db_table,
+)
+
+SEED_SQL = (
+    # Пользователи.
+    """
+    INSERT INTO user_user (password, is_superuser, is_staff, is_active,
+                           date_joined, email, username, first_name,
+                           last_name)
+    SELECT '!', false, false, true, now(),
+           'explain' || n || '@foodgram.ru', 'explain' || n, 'Имя', 'Фамилия'
+    FROM generate_series(1, %(users)s) AS n
+    """,
+    # Тэги.
+    """
+    INSERT INTO recipes_tag (name, slug)
+    SELECT 'Тэг ' || n, 'explain-' || n FROM generate_series(1, 10) AS n
+    ON CONFLICT DO NOTHING
+    """,
+    # Рецепты случайных авторов.
+    """
+    INSERT INTO recipes_recipe (author_id, name, image, text, cooking_time,
+                                favorites_count, in_carts_count)
+    SELECT u.ids[1 + floor(random() * array_length(u.ids, 1))::int],
+           'Рецепт ' || n, 'recipe_images/explain.png', 'Описание',
+           1 + floor(random() * 120)::int, 0, 0
+    FROM generate_series(1, %(recipes)s) AS n,
+         (SELECT array_agg(id) AS ids FROM user_user
+          WHERE email LIKE 'explain%%') AS u
+    """,
+    # По два тэга на рецепт.
+    """
+    INSERT INTO recipes_recipetag (recipe_id, tag_id)
+    SELECT r.id, t.ids[1 + (r.id + s) %% array_length(t.ids, 1)]
+    FROM recipes_recipe AS r, generate_series(0, 1) AS s,
+         (SELECT array_agg(id) AS ids FROM recipes_tag) AS t
+    ON CONFLICT DO NOTHING
+    """,
+    # Избранное, корзины и подписки случайных пар.
+    """
+    INSERT INTO recipes_favorite (user_id, recipe_id)
+    SELECT p.user_id, p.recipe_id
+    FROM (
+        SELECT u.id AS user_id,
+               r.min_id + floor(random() * (r.max_id - r.min_id + 1))::int
+               AS recipe_id
+        FROM user_user AS u, generate_series(1, 5),
+             (SELECT min(id) AS min_id, max(id) AS max_id
+              FROM recipes_recipe) AS r
+        WHERE u.email LIKE 'explain%%'
+    ) AS p
+    JOIN recipes_recipe ON recipes_recipe.id = p.recipe_id
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO recipes_shopcard (user_id, recipe_id)
+    SELECT user_id, recipe_id FROM recipes_favorite
+    WHERE random() < 0.5
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO user_subscribe (user_id, author_id)
+    SELECT u.id, a.id
+    FROM user_user AS u
+    JOIN user_user AS a ON a.id <> u.id AND a.id %% 50 = u.id %% 7
+    WHERE u.email LIKE 'explain%%' AND a.email LIKE 'explain%%'
+    ON CONFLICT DO NOTHING
+    """,
+    'ANALYZE',
+)
+
+
+class Command(BaseCommand):
+    help = ('Записывает планы EXPLAIN ANALYZE для фильтров рецептов и '
+            'проверяет, что большие таблицы читаются через индексы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='Сначала заполнить базу указанным числом рецептов.'
+        )
+        parser.add_argument(
+            '--users', type=int, default=10000,
+            help='Число пользователей для --seed.'
+        )
+        parser.add_argument(
+            '--output', default='explain_plans.txt',
+            help='Файл, в который записываются планы.'
+        )
+
+    def seed(self, recipes, users):
+        started = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql in SEED_SQL:
+                cursor.execute(sql, {'recipes': recipes, 'users': users})
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        self.stdout.write(
+            f'Создано {recipes} рецептов за '
+            f'{time.monotonic() - started:.1f} с.'
+        )
+
+    def get_querysets(self):
+        user = User.objects.filter(subscriber__isnull=False).first()
+        recipe = Recipe.objects.filter(favorites__isnull=False).first()
+        if user is None or recipe is None:
+            raise CommandError('База пуста, запустите команду с --seed.')
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'recipes by tags': Recipe.objects.filter(
+                tags__slug__in=slugs
+            ).distinct()[:6],
+            'recipes by author': Recipe.objects.filter(
+                author=recipe.author
+            )[:6],
+            'favorited recipes': Recipe.objects.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                ))
+            ).filter(is_favorited=True)[:6],
+            'favorite count': Favorite.objects.filter(
+                recipe=recipe
+            ).values('recipe').annotate(total=Count('id')),
+            'subscriptions': User.objects.filter(
+                subscribing__user=user
+            ).order_by('-subscribing__id')[:6],
+            'followers': Subscribe.objects.filter(
+                author=recipe.author
+            ).values('user'),
+            'shopping list': RecipeIngredient.objects.filter(
+                recipe__in=ShopCard.objects.filter(
+                    user=user
+                ).values('recipe')
+            ).values('ingredient').annotate(amount=Sum('amount')),
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда работает только с PostgreSQL.')
+        if options['seed']:
+            self.seed(options['seed'], options['users'])
+        seq_scans = []
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            for name, queryset in self.get_querysets().items():
+                plan = queryset.explain(analyze=True, buffers=True)
+                output.write(f'-- {name}\n{queryset.query}\n\n{plan}\n\n')
+                for table in re.findall(r'Seq Scan on (\w+)', plan):
+                    if table in LARGE_TABLES:
+                        seq_scans.append(f'{name}: {table}')
+        self.stdout.write(f'Планы записаны в {options["output"]}.')
+        if seq_scans:
+            raise CommandError(
+                'Последовательное чтение больших таблиц: '
+                + ', '.join(seq_scans)
+            )
+        self.stdout.write(
+            self.style.SUCCESS('Все запросы используют индексы.')
+        )
@@ -0,0 +1,49 @@
+from django.conf import settings
+
+from api.cache import ingredient_cache
+from recipes.loaders import LoadCommand, batched, copy_rows, read_rows
+from recipes.models import (
+    INGREDIENT_NAME_MAX_LENGTH, MEASUREMENT_UNIT_MAX_LENGTH, Ingredient
+)
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+
+
+class Command(LoadCommand):
+    help = ('Загружает ингредиенты из CSV (название, единица) или JSON; '
+            'уже существующие названия пропускаются.')
+
+    default_path = settings.BASE_DIR / 'data' / 'ingredients.csv'
+
+    def get_rows(self, path, throughput):
+        for row in throughput.count(read_rows(path, INGREDIENT_FIELDS)):
+            if not isinstance(row, dict):
+                throughput.skipped += 1
+                continue
+            name = str(row.get('name') or '').strip()
+            unit = str(row.get('measurement_unit') or '').strip()
+            if (not name or len(name) > INGREDIENT_NAME_MAX_LENGTH
+                    or not unit or len(unit) > MEASUREMENT_UNIT_MAX_LENGTH):
+                throughput.skipped += 1
+                continue
+            yield name, unit
+
+    def load(self, path, batch_size, throughput):
+        rows = self.get_rows(path, throughput)
+        if self.use_copy:
+            throughput.written = copy_rows(
+                Ingredient, INGREDIENT_FIELDS, rows
+            )
+        else:
+            before = Ingredient.objects.count()
+            for batch in batched(rows, batch_size):
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch],
+                    batch_size=batch_size, ignore_conflicts=True
+                )
+            throughput.written = Ingredient.objects.count() - before
+        # bulk_create и COPY не посылают сигналов, поэтому кеш справочника
+        # и поисковый индекс сбрасываются явно.
+        if throughput.written:
+            ingredient_cache.invalidate()
@@ -0,0 +1,137 @@
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from api.cache import bump_recipe_versions
+from api.matching import log_recipe_changes
+from api.search import update_search_vectors
+from recipes.loaders import LoadCommand, batched, copy_rows, read_json
+from recipes.models import (
+    COOKING_TIME_MIN, RECIPE_NAME_MAX_LENGTH, Ingredient, Recipe,
+    RecipeIngredient, RecipeTag, Tag
+)
+from user.models import User
+
+
+def positive_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= COOKING_TIME_MIN else None
+
+
+class Command(LoadCommand):
+    help = ('Загружает рецепты из JSON-массива объектов с полями author '
+            '(email), name, text, cooking_time, image, tags (slug) и '
+            'ingredients ([{"name": ..., "amount": ...}]). Авторы, тэги и '
+            'ингредиенты должны уже существовать; рецепты с названием, '
+            'которое у автора уже есть, пропускаются.')
+
+    def load(self, path, batch_size, throughput):
+        if not str(path).endswith('.json'):
+            raise CommandError('Рецепты загружаются только из JSON.')
+        tags = Tag.objects.in_bulk(field_name='slug')
+        items = throughput.count(read_json(path))
+        for batch in batched(items, batch_size):
+            recipes = self.build(batch, tags, throughput)
+            with transaction.atomic():
+                self.write(recipes, batch_size)
+            throughput.written += len(recipes)
+        if throughput.written:
+            log_recipe_changes([None])
+            bump_recipe_versions([])
+
+    def build(self, items, tags, throughput):
+        batch = [item for item in items if isinstance(item, dict)]
+        authors = User.objects.in_bulk(
+            {str(item.get('author')) for item in batch},
+            field_name='email'
+        )
+        ingredients = Ingredient.objects.in_bulk(
+            {str(ingredient.get('name'))
+             for item in batch
+             for ingredient in item.get('ingredients') or ()
+             if isinstance(ingredient, dict)},
+            field_name='name'
+        )
+        # Повторная загрузка того же файла не должна дублировать рецепты.
+        existing = set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={str(item.get('name') or '').strip() for item in batch}
+        ).values_list('author_id', 'name'))
+        recipes = []
+        for item in batch:
+            recipe = self.build_recipe(item, authors, ingredients, tags)
+            if recipe is None or (recipe.author_id, recipe.name) in existing:
+                continue
+            existing.add((recipe.author_id, recipe.name))
+            recipes.append(recipe)
+        throughput.skipped += len(items) - len(recipes)
+        return recipes
+
+    def build_recipe(self, item, authors, ingredients, tags):
+        author = authors.get(str(item.get('author')))
+        name = str(item.get('name') or '').strip()
+        cooking_time = positive_int(item.get('cooking_time'))
+        if (author is None or not name or cooking_time is None
+                or len(name) > RECIPE_NAME_MAX_LENGTH
+                or not item.get('image')):
+            return None
+        amounts = {}
+        for ingredient in item.get('ingredients') or ():
+            if not isinstance(ingredient, dict):
+                return None
+            found = ingredients.get(str(ingredient.get('name')))
+            amount = positive_int(ingredient.get('amount'))
+            if found is None or amount is None or found.pk in amounts:
+                return None
+            amounts[found.pk] = amount
+        recipe_tags = {tags.get(str(slug)) for slug in item.get('tags') or ()}
+        if not amounts or not recipe_tags or None in recipe_tags:
+            return None
+        recipe = Recipe(
+            author=author, name=name, text=str(item.get('text') or ''),
+            image=str(item['image']), cooking_time=cooking_time
+        )
+        recipe.loaded_amounts = amounts
+        recipe.loaded_tags = recipe_tags
+        return recipe
+
+    def write(self, recipes, batch_size):
+        # bulk_create возвращает первичные ключи и на PostgreSQL, и на
+        # SQLite, поэтому связи пишутся следом без повторного чтения.
+        Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+        ingredient_rows = [
+            (recipe.pk, ingredient_id, amount)
+            for recipe in recipes
+            for ingredient_id, amount in recipe.loaded_amounts.items()
+        ]
+        tag_rows = [
+            (recipe.pk, tag.pk)
+            for recipe in recipes
+            for tag in recipe.loaded_tags
+        ]
+        if self.use_copy:
+            copy_rows(RecipeIngredient, ('recipe', 'ingredient', 'amount'),
+                      ingredient_rows)
+            copy_rows(RecipeTag, ('recipe', 'tag'), tag_rows)
+        else:
+            self.write_links(ingredient_rows, tag_rows, batch_size)
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes])
+        )
+
+    def write_links(self, ingredient_rows, tag_rows, batch_size):
+        RecipeIngredient.objects.bulk_create(
+            [RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                              amount=amount)
+             for recipe_id, ingredient_id, amount in ingredient_rows],
+            batch_size=batch_size
+        )
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id, tag_id in tag_rows],
+            batch_size=batch_size, ignore_conflicts=True
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import RECIPE_COUNTERS_VERSION_KEY, bump_version
+from recipes.models import Favorite, Recipe, ShopCard
+
+
+def count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe').annotate(total=Count('id'))
+        .values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает favorites_count и in_carts_count рецептов, '
+            'если они разошлись с таблицами избранного и корзин.')
+
+    def handle(self, *args, **options):
+        favorites = count_subquery(Favorite)
+        in_carts = count_subquery(ShopCard)
+        updated = Recipe.objects.filter(
+            ~Q(favorites_count=favorites) | ~Q(in_carts_count=in_carts)
+        ).update(favorites_count=favorites, in_carts_count=in_carts)
+        if updated:
+            bump_version(RECIPE_COUNTERS_VERSION_KEY)
+        self.stdout.write(f'Исправлено рецептов: {updated}.')
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import RecipeChange
+
+
+class Command(BaseCommand):
+    help = ('Удаляет старые записи журнала изменений состава рецептов; '
+            'отставшие индексы в памяти после этого перестроятся целиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='Сколько дней хранить записи.'
+        )
+
+    def handle(self, *args, **options):
+        deleted, _ = RecipeChange.objects.filter(
+            created__lt=timezone.now() - timedelta(days=options['days'])
+        ).delete()
+        self.stdout.write(f'Удалено записей: {deleted}.')
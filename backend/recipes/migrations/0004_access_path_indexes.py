@@ -0,0 +1,50 @@
+# Generated by Django 4.2.15 on 2026-10-17 19:41
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def delete_duplicate_recipe_tags(apps, schema_editor):
+    # До unique_recipe_tag один тег мог быть привязан к рецепту дважды;
+    # остаётся первая привязка.
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    RecipeTag.objects.filter(Exists(RecipeTag.objects.filter(
+        recipe=OuterRef('recipe'), tag=OuterRef('tag'), id__lt=OuterRef('id')
+    ))).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['recipe'], include=('ingredient', 'amount'), name='recipeingr_recipe_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetag',
+            index=models.Index(fields=['tag', 'recipe'], name='recipetag_tag_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shopcard',
+            index=models.Index(fields=['recipe', 'user'], name='shopcard_recipe_user_idx'),
+        ),
+        migrations.RunPython(
+            delete_duplicate_recipe_tags, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+    ]
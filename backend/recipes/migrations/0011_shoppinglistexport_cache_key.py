@@ -0,0 +1,18 @@
+# Generated by Django 4.2.15 on 2026-10-17 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglistexport',
+            name='cache_key',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+    ]
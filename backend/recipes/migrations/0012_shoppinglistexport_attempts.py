@@ -0,0 +1,23 @@
+# Generated by Django 4.2.15 on 2026-10-17 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shoppinglistexport_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglistexport',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistexport',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
+import uuid
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
-from django.db.models import UniqueConstraint
+from django.db.models import Index, Q, UniqueConstraint
 
 from user.models import User
 
@@ -12,6 +15,9 @@ MEASUREMENT_UNIT_MAX_LENGTH = 64
 RECIPE_NAME_MAX_LENGTH = 256
 COOKING_TIME_MIN = 1
 RECIPE_IMAGE_UPLOAD_PATH = 'recipe_images'
+SHOPPING_LIST_UPLOAD_PATH = 'shopping_lists'
+EXPORT_STATUS_MAX_LENGTH = 16
+EXPORT_CACHE_KEY_MAX_LENGTH = 128
 
 
 class Tag(models.Model):
@@ -55,15 +61,50 @@ class Recipe(models.Model):
     text = models.TextField()
     cooking_time = models.PositiveIntegerField(
         validators=[MinValueValidator(COOKING_TIME_MIN)])
+    favorites_count = models.PositiveIntegerField(
+        'Число добавлений в избранное', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Число добавлений в корзину', default=0, editable=False
+    )
+    fanned_out = models.BooleanField(
+        'Разослан в ленты подписчиков', default=False, editable=False
+    )
+    # Заполняется только на PostgreSQL, GIN-индекс создаёт миграция.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    DENORMALIZED_FIELDS = (
+        'favorites_count', 'in_carts_count', 'fanned_out', 'search_vector'
+    )
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+            Index(fields=['-favorites_count', '-id'],
+                  name='recipe_popularity_idx'),
+            # Рецепты, которые лента подписок дочитывает при запросе.
+            Index(fields=['author', '-id'], name='recipe_feed_pull_idx',
+                  condition=Q(fanned_out=False)),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счётчики, рассылка и поисковый вектор меняются только через
+        # QuerySet.update(); полный save() записал бы обратно значения,
+        # прочитанные до чужих изменений.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class RecipeTag(models.Model):
 
@@ -79,6 +120,15 @@ class RecipeTag(models.Model):
         related_name='tags_recipes'
     )
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['recipe', 'tag'],
+                             name='unique_recipe_tag')
+        ]
+        indexes = [
+            Index(fields=['tag', 'recipe'], name='recipetag_tag_recipe_idx'),
+        ]
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -97,6 +147,13 @@ class RecipeIngredient(models.Model):
         validators=[MinValueValidator(COOKING_TIME_MIN)],
     )
 
+    class Meta:
+        indexes = [
+            # Сводка списка покупок читается только из индекса.
+            Index(fields=['recipe'], include=['ingredient', 'amount'],
+                  name='recipeingr_recipe_cover_idx'),
+        ]
+
 
 class Favorite(models.Model):
     user = models.ForeignKey(
@@ -116,6 +173,9 @@ class Favorite(models.Model):
             UniqueConstraint(fields=['user', 'recipe'],
                              name='unique_favorite')
         ]
+        indexes = [
+            Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ]
         verbose_name = 'Любимый рецепт пользователей'
         verbose_name_plural = 'Любимые рецепты пользователей'
 
@@ -138,5 +198,105 @@ class ShopCard(models.Model):
             UniqueConstraint(fields=['user', 'recipe'],
                              name='unique_shopcart')
         ]
+        indexes = [
+            Index(fields=['recipe', 'user'], name='shopcard_recipe_user_idx'),
+        ]
         verbose_name = 'Список покупок пользователей'
         verbose_name_plural = 'Списки покупок пользователей'
+
+
+class ShortLink(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        related_name='short_link',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+
+
+class ShoppingListExport(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Формируется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list_exports',
+        on_delete=models.CASCADE,
+    )
+    recipe_ids = models.JSONField()
+    # Ключ документа в кеше: состав корзины и версия списков покупок.
+    cache_key = models.CharField(
+        max_length=EXPORT_CACHE_KEY_MAX_LENGTH, blank=True
+    )
+    status = models.CharField(
+        max_length=EXPORT_STATUS_MAX_LENGTH,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    file = models.FileField(upload_to=SHOPPING_LIST_UPLOAD_PATH, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            Index(fields=['status', 'created'],
+                  name='export_status_created_idx'),
+        ]
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        # Индекс ограничения читается в обратном порядке и служит
+        # keyset-пагинации ленты пользователя.
+        constraints = [
+            UniqueConstraint(fields=['user', 'recipe'],
+                             name='unique_feed_entry')
+        ]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Лента подписок'
+
+
+class RecipeChange(models.Model):
+    """Журнал рецептов с изменённым составом.
+
+    По нему индексы в памяти процессов догоняют базу, не перечитывая её
+    целиком. Пустой recipe_id означает «перестроить всё» после массовой
+    загрузки.
+    """
+
+    recipe_id = models.BigIntegerField(null=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Изменение состава рецепта'
+        verbose_name_plural = 'Изменения состава рецептов'
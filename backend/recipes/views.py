@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from django.http import Http404
+from django.shortcuts import redirect
 
-# Create your views here.
+from api.links import resolve_short_link
+
+
+async def short_link_redirect(request, code):
+    recipe_id = await resolve_short_link(code)
+    if recipe_id is None:
+        raise Http404('Ссылка не найдена.')
+    return redirect(f'/recipes/{recipe_id}')
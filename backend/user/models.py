@@ -1,5 +1,5 @@
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Index, UniqueConstraint
 from django.contrib.auth.models import AbstractUser
 
 
@@ -40,5 +40,8 @@ class Subscribe(models.Model):
             UniqueConstraint(fields=['user', 'author'],
                              name='unique_subscription')
         ]
+        indexes = [
+            Index(fields=['author', 'user'], name='subscribe_author_user_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'